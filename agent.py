@@ -1,33 +1,254 @@
 import uuid
 from typing import TypedDict
 from dotenv import load_dotenv
-import os
-from langgraph.graph import StateGraph, END 
-from langgraph.types import interrupt
-from langchain_google_genai import ChatGoogleGenerativeAI
-from fpdf import FPDF
 import os, json
-from markdown import markdown
-try:
-    from weasyprint import HTML, CSS
-    WEASYPRINT_AVAILABLE = True
-except Exception:
-    WEASYPRINT_AVAILABLE = False
-from fpdf import FPDF
-from markdown import markdown
-from weasyprint import HTML, CSS
-import os
+import io, re, base64, threading, hashlib
+from collections import OrderedDict
+from functools import lru_cache
 import requests, urllib.parse
-from langgraph.checkpoint.memory import MemorySaver
+from md_formatter import format_letter_markdown
+from startup import timed_load
+from artifact_store import get_store
+from llm_gateway import gateway_from_env
+from metrics import span, traced_node, record_llm_usage, observe, LLM_SECONDS, PDF_RENDER_SECONDS, PDF_SIZE_BYTES
+
+# Heavy dependencies (langgraph, langchain_google_genai, markdown, WeasyPrint) are
+# imported on first use so that importing this module stays cheap.
 
 
 load_dotenv()
 
-if "GOOGLE_API_KEY" not in os.environ:
-    raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it before running.")
+# LLM client, built on first use (see get_llm)
+llm = None
+_llm_lock = threading.Lock()
+
+
+def get_llm():
+    """Returns the shared chat model, constructing it on first call."""
+    global llm
+    if llm is None:
+        with _llm_lock:
+            if llm is None:
+                if "GOOGLE_API_KEY" not in os.environ:
+                    raise ValueError("GOOGLE_API_KEY environment variable not set. Please set it before running.")
+                with timed_load("llm_client"):
+                    from langchain_google_genai import ChatGoogleGenerativeAI
+                    # Retries are handled by the gateway; the client timeout matches the gateway's
+                    # per-attempt timeout so a hung call gives its worker thread back
+                    llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro", max_retries=0,
+                                                 timeout=float(os.getenv("LLM_ATTEMPT_TIMEOUT_S", "90")))
+    return llm
+
+
+@lru_cache(maxsize=None)
+def get_gateway():
+    """Shared LLM gateway (rate limits, priorities, retries, deadlines) around get_llm()."""
+    return gateway_from_env(get_llm)
+
+
+@lru_cache(maxsize=None)
+def pdf_stack():
+    """Imports the Markdown → HTML → PDF toolchain once: (markdown, HTML, CSS)."""
+    with timed_load("pdf_stack"):
+        from markdown import markdown
+        from weasyprint import HTML, CSS
+    return markdown, HTML, CSS
+
+# Process-wide render cap shared by interactive and batch sessions
+# (LLM concurrency is owned by the gateway, see LLM_CONCURRENCY in llm_gateway)
+RENDER_CONCURRENCY = int(os.getenv("PDF_RENDER_CONCURRENCY", "2"))
+_render_slots = threading.BoundedSemaphore(RENDER_CONCURRENCY)
+
+# "standard" keeps the web fonts and visual effects; "compact" renders a lean
+# print layout (see compact_letter_css) with optimized images. Per session via
+# state["render_profile"].
+RENDER_PROFILES = ("standard", "compact")
+PDF_RENDER_PROFILE = os.getenv("PDF_RENDER_PROFILE", "standard")
+PDF_IMAGE_DPI = int(os.getenv("PDF_IMAGE_DPI", "150"))
+
+
+def resolve_render_profile(name: str | None) -> str:
+    profile = (name or PDF_RENDER_PROFILE).lower()
+    if profile not in RENDER_PROFILES:
+        print(f"⚠️ Unknown render profile {profile!r}, using standard")
+        return "standard"
+    return profile
+
+
+def invoke_llm(prompt: str, prompt_type: str = "other", priority: str = "interactive"):
+    """Calls the LLM through the shared gateway; records latency (queueing included) and tokens."""
+    with span("llm.invoke", LLM_SECONDS, prompt_type=prompt_type) as attrs:
+        attrs["priority"] = priority
+        response = get_gateway().invoke(prompt, prompt_type=prompt_type, priority=priority)
+        attrs.update(record_llm_usage(prompt_type, response))
+    return response
+
+# --- Logo helpers ---
+
+LOGO_CACHE_SIZE = int(os.getenv("LOGO_CACHE_SIZE", "256"))
+
+
+def monogram_initials(name: str, length: int = 2) -> str:
+    """Initials the way ui-avatars builds them: first letter of the first words,
+    or the first letters of a single-word name."""
+    words = re.findall(r"\w+", name or "")
+    if not words:
+        return "?"
+    if len(words) == 1:
+        return words[0][:length].upper()
+    return "".join(w[0] for w in words[:length]).upper()
+
+
+def monogram_svg(name: str, size: int = 320, background: str = "#000000",
+                 color: str = "#ffffff", bold: bool = True,
+                 font_family: str = "-apple-system, BlinkMacSystemFont, 'Segoe UI', 'Roboto', "
+                                    "'Helvetica Neue', Arial, sans-serif") -> str:
+    """Builds a square SVG monogram matching the ui-avatars look."""
+    initials = monogram_initials(name)
+    weight = 600 if bold else 400
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}px" height="{size}px" '
+        f'viewBox="0 0 {size} {size}">'
+        f'<rect fill="{background}" width="{size}" height="{size}"/>'
+        f'<text x="50%" y="50%" style="line-height: 1;font-family: {font_family};" '
+        f'alignment-baseline="middle" text-anchor="middle" font-size="{size // 2}" '
+        f'font-weight="{weight}" dy=".1em" dominant-baseline="middle" fill="{color}">'
+        f"{initials}</text></svg>"
+    )
+
+
+def svg_data_uri(svg_text: str) -> str:
+    return "data:image/svg+xml;utf8," + urllib.parse.quote(svg_text)
+
+
+_SVG_NOISE = re.compile(r"<\?xml.*?\?>|<!DOCTYPE.*?>|<!--.*?-->|<metadata\b.*?</metadata>", re.S | re.I)
+
+
+def minify_svg(svg_text: str) -> str:
+    """Drops the XML prolog, comments and metadata and collapses whitespace between tags."""
+    svg_text = _SVG_NOISE.sub("", svg_text)
+    svg_text = re.sub(r">\s+<", "><", svg_text)
+    return re.sub(r"\s{2,}", " ", svg_text).strip()
+
+
+# Raster logos are downscaled to 2x the 76px header slot for the compact profile
+LOGO_MAX_PX = int(os.getenv("LOGO_MAX_PX", "152"))
+PDF_JPEG_QUALITY = int(os.getenv("PDF_JPEG_QUALITY", "80"))
+
+
+def optimize_raster_logo(content_type: str, data: bytes, max_px: int = LOGO_MAX_PX) -> tuple[str, bytes]:
+    """Downscales and re-encodes a raster logo with Pillow; returns the input when that doesn't help."""
+    try:
+        from PIL import Image
+        img = Image.open(io.BytesIO(data))
+        img.thumbnail((max_px, max_px))
+        out = io.BytesIO()
+        if img.mode in ("RGBA", "LA", "P") or "transparency" in img.info:
+            img.save(out, format="PNG", optimize=True)
+            optimized = ("image/png", out.getvalue())
+        else:
+            img.convert("RGB").save(out, format="JPEG", quality=PDF_JPEG_QUALITY, optimize=True)
+            optimized = ("image/jpeg", out.getvalue())
+    except Exception as e:
+        print(f"⚠️ Logo optimization skipped: {e}")
+        return content_type, data
+    return optimized if len(optimized[1]) < len(data) else (content_type, data)
+
+
+@lru_cache(maxsize=LOGO_CACHE_SIZE)
+def monogram_data_uri(company_name: str, compact: bool = False) -> str:
+    if compact:
+        return svg_data_uri(minify_svg(monogram_svg(company_name, size=76, font_family="Helvetica, Arial, sans-serif")))
+    return svg_data_uri(monogram_svg(company_name))
+
+
+@lru_cache(maxsize=LOGO_CACHE_SIZE)
+def _fetch_logo_data_uri(url: str, compact: bool = False) -> str:
+    # Raises on failure so that lru_cache never stores a failed fetch.
+    r = requests.get(url, timeout=5)
+    r.raise_for_status()
+    content_type = r.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "image/svg+xml" or url.lower().split("?")[0].endswith(".svg"):
+        return svg_data_uri(minify_svg(r.text) if compact else r.text)
+    content_type, data = content_type or "image/png", r.content
+    if compact:
+        content_type, data = optimize_raster_logo(content_type, data)
+    return f"data:{content_type};base64," + base64.b64encode(data).decode("ascii")
+
+
+def inline_logo(company_name: str, logo_url: str | None = None, compact: bool = False) -> str:
+    """
+    Returns a data URI for the letter header logo.
+    Without `logo_url` a local monogram is generated; otherwise the logo is fetched
+    once and cached. Falls back to the original URL if the fetch fails.
+    `compact` minifies SVGs and downscales raster logos (see optimize_raster_logo).
+    """
+    if not logo_url:
+        return monogram_data_uri(company_name, compact)
+    if logo_url.startswith("data:"):
+        return logo_url
+    try:
+        return _fetch_logo_data_uri(logo_url, compact)
+    except Exception:
+        return logo_url  # fallback to remote URL
+
+# --- Letter Markdown cache ---
+
+FORMAT_CACHE_SIZE = int(os.getenv("FORMAT_CACHE_SIZE", "512"))
+# Default for sessions that don't ask either way: polish reviewed text with the LLM?
+LLM_POLISH_DEFAULT = os.getenv("LETTER_LLM_POLISH", "false").lower() in ("1", "true", "yes")
+_format_cache: "OrderedDict[tuple[str, str], str]" = OrderedDict()
+_format_cache_lock = threading.Lock()
+
 
-# Initialize LLM
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro")
+def _format_cache_get(key):
+    with _format_cache_lock:
+        if key in _format_cache:
+            _format_cache.move_to_end(key)
+            return _format_cache[key]
+    return None
+
+
+def _format_cache_put(key, value: str) -> None:
+    with _format_cache_lock:
+        _format_cache[key] = value
+        _format_cache.move_to_end(key)
+        while len(_format_cache) > FORMAT_CACHE_SIZE:
+            _format_cache.popitem(last=False)
+
+
+def refine_letter_markdown(text: str, key_terms=(), polish: bool = False, priority: str = "interactive") -> str:
+    """
+    Returns formatted Markdown for `text`, keyed by a content hash.
+    A cached result is reused when the same text was formatted before (an LLM
+    polish is preferred over the rule-based result). Otherwise the deterministic
+    formatter runs, and the LLM refine pass only runs when `polish` is set.
+    """
+    digest = hashlib.sha256("\x00".join([text, *key_terms]).encode("utf-8")).hexdigest()
+    for mode in (("llm",) if polish else ("llm", "rules")):
+        cached = _format_cache_get((digest, mode))
+        if cached is not None:
+            print(f"✅ Reusing cached {mode} formatting ({digest[:12]})")
+            return cached
+
+    if not polish:
+        formatted_md = format_letter_markdown(text, key_terms)
+        _format_cache_put((digest, "rules"), formatted_md)
+        return formatted_md
+
+    format_prompt = f"""
+    Refine the following letter in a professional, polished tone using Markdown.
+    Use **bold** for key phrases, *italics* for emphasis, and ### for section headers.
+    Keep it visually structured and avoid monotony.
+    RESPOND WITH ONLY THE OFFER LETTER CONTENT — NO extra explanation.
+    
+    Letter:
+    {text}
+    """
+    formatted_response = invoke_llm(format_prompt, "polish", priority)
+    formatted_md = formatted_response.content.strip()
+    _format_cache_put((digest, "llm"), formatted_md)
+    return formatted_md
 
 # --- Define Agent State ---
 
@@ -50,6 +271,12 @@ class TenureAgentState(TypedDict):
     email_draft: str
     formatted_output: str
     user_reviewed_text:str
+    llm_polish: bool
+    auto_approve: bool
+    pdf_file: str
+    priority: str
+    render_profile: str
+    pdf_size_bytes: int
 
 # --- Define Graph Nodes ---
 
@@ -88,7 +315,7 @@ def compose_tenure_template(state: TenureAgentState) -> TenureAgentState:
     
     Keep it concise, logical, and use placeholders for personalization.
     """
-    response = llm.invoke(prompt)
+    response = invoke_llm(prompt, "template", state.get("priority", "interactive"))
     state["tenure_template"] = response.content.strip()
     return state
 
@@ -100,7 +327,7 @@ def generate_tenure_letter(state: TenureAgentState,**kwargs) -> TenureAgentState
     print("======================================")
 
     # ✅ 2. If the user already provided reviewed text, use it
-    if state.get("user_reviewed_text") != "":
+    if state.get("user_reviewed_text"):
         print("✅ Resumed with human-edited letter. Skipping regeneration.")
         state["generated_letter_text"] = state.get("user_reviewed_text")
         return state
@@ -123,46 +350,140 @@ def generate_tenure_letter(state: TenureAgentState,**kwargs) -> TenureAgentState
     our company email : {state['company_email']}
 
     """
-    response = llm.invoke(prompt)
+    response = invoke_llm(prompt, "letter", state.get("priority", "interactive"))
     state["generated_letter_text"] = response.content.strip()
     print (state["generated_letter_text"])
     return state
 
 
-def format_letter_output(state: TenureAgentState) -> TenureAgentState:
+def compact_letter_css(red: str, black: str) -> str:
     """
-    Formats the letter using the LLM and renders a professional, visually-rich PDF.
-    Header: elegant, red + black (Coca-Cola style) with a triangular separator (not a straight line),
-            dynamic logo / company name / address.
-    Footer: compact contact line.
-    Uses tasteful fonts (Playfair Display for headline, Montserrat for body) with fallbacks.
+    Print stylesheet for the compact profile: the same header/footer layout in flat
+    colors with one system font family (fewer, smaller embedded font subsets), and
+    no web fonts, shadows, gradients or fixed watermark layer.
     """
-    print("---NODE: FORMATTING LETTER OUTPUT (HTML + PDF)---")
+    return f"""
+@page {{
+    size: A4;
+    margin: 0;
+}}
 
-    data={
-        "letter_text": state["generated_letter_text"],
-        "message": "Please review and edit the generated offer letter.",
-    }
-    state["user_reviewed_text"]=interrupt(data)
+body {{
+    margin: 0;
+    font-family: Helvetica, Arial, sans-serif;
+    color: #111;
+    line-height: 1.45;
+}}
 
+.letter-header {{
+    display: flex;
+    height: 110px;
+    width: 100%;
+}}
 
-    # --- Step 1: Refine the letter content via LLM (polished Markdown) ---
-    final_text = state.get("user_reviewed_text") or state.get("generated_letter_text")
+.header-left {{
+    background: {black};
+    color: #fff;
+    display: flex;
+    align-items: center;
+    gap: 18px;
+    padding: 18px 28px;
+    min-width: 520px;
+    box-sizing: border-box;
+}}
 
-    format_prompt = f"""
-    Refine the following letter in a professional, polished tone using Markdown.
-    Use **bold** for key phrases, *italics* for emphasis, and ### for section headers.
-    Keep it visually structured and avoid monotony.
-    RESPOND WITH ONLY THE OFFER LETTER CONTENT — NO extra explanation.
-    
-    Letter:
-    {final_text}
+.logo-wrap {{
+    width: 72px;
+    height: 72px;
+    display: flex;
+    align-items: center;
+    justify-content: center;
+    flex-shrink: 0;
+}}
+
+.logo {{
+    max-width: 72px;
+    max-height: 72px;
+    display: block;
+}}
+
+.company-meta {{
+    display: flex;
+    flex-direction: column;
+    gap: 4px;
+}}
+
+.company-name {{
+    font-size: 20px;
+    font-weight: 700;
+    letter-spacing: 0.6px;
+}}
+
+.company-address {{
+    font-size: 12px;
+    color: #d9d9d9;
+    max-width: 420px;
+    line-height: 1.25;
+}}
+
+.header-right {{
+    flex: 1;
+    background: {red};
+}}
+
+.content {{
+    padding: 40px 72px 80px 72px;
+    box-sizing: border-box;
+}}
+
+h1, h2, h3 {{
+    color: {black};
+}}
+
+h1 {{
+    font-size: 20px;
+    margin-bottom: 8px;
+}}
+
+p, li {{
+    font-size: 13.5px;
+}}
+
+strong {{
+    color: {black};
+    font-weight: 700;
+}}
+
+em {{
+    color: #444;
+    font-style: italic;
+}}
+
+.letter-footer {{
+    position: fixed;
+    bottom: 0;
+    left: 0;
+    right: 0;
+    display: flex;
+    justify-content: space-between;
+    padding: 10px 36px;
+    font-size: 12px;
+    color: #666;
+    background: #fff;
+    border-top: 1px solid #eee;
+    box-sizing: border-box;
+}}
     """
-    formatted_response = llm.invoke(format_prompt)
-    formatted_md = formatted_response.content.strip()
-    state["formatted_letter_text"] = formatted_md
 
+
+def build_letter_html(state: TenureAgentState, formatted_md: str, profile: str = "standard") -> tuple[str, str]:
+    """
+    Builds the full letter HTML and its stylesheet from formatted Markdown and branding in `state`.
+    `profile` is "standard" or "compact" (see RENDER_PROFILES).
+    """
+    compact = profile == "compact"
     # --- Step 2: Convert Markdown → HTML body ---
+    markdown, _, _ = pdf_stack()
     html_body = markdown(formatted_md, extensions=["extra", "sane_lists"])
 
     # --- Step 3: Gather dynamic branding from state (with sensible defaults) ---
@@ -171,26 +492,7 @@ def format_letter_output(state: TenureAgentState) -> TenureAgentState:
         "company_address",
         "Rmz, Millenia Business Park, Campus 1A, No.143, Dr.M.G.R. Road, Perungudi, Chennai - 600096"
     )
-    def inline_svg_from_url(url: str) -> str:
-        """
-        Fetches SVG from `url` and returns a data:image/svg+xml;utf8,<encoded> URI.
-        Falls back to the original URL if fetch fails.
-        """
-        try:
-            r = requests.get(url, timeout=5)
-            r.raise_for_status()
-            svg_text = r.text
-            return "data:image/svg+xml;utf8," + urllib.parse.quote(svg_text)
-        except Exception:
-            return url  # fallback to remote URL
-
-    # usage inside your function
-    if not state.get("company_logo"):
-        # build UI-Avatars or DiceBear URL (as above)
-        external_logo = f"https://ui-avatars.com/api/?name={urllib.parse.quote_plus(company_name)}&size=320&background=black&color=fff&bold=true&format=svg"
-        logo_url = inline_svg_from_url(external_logo)
-    else:
-        logo_url = state["company_logo"]
+    logo_url = inline_logo(company_name, state.get("company_logo"), compact=compact)
     company_website = state.get("company_website", "AiInternational.com")
     contact_email = state.get("company_email", "AiInternational")
     session_id = state.get("session_id", "unknown")
@@ -227,7 +529,10 @@ def format_letter_output(state: TenureAgentState) -> TenureAgentState:
     # --- Step 5: Compose a refined CSS with pretty fonts and triangular separator ---
     # Note: For best PDF font embedding, ensure your renderer can fetch Google Fonts or
     # provide local fonts. Fallbacks are included.
-    css = f"""
+    if compact:
+        css = compact_letter_css(red, black)
+    else:
+        css = f"""
 /* Google fonts (used when renderer supports web fonts) */
 @import url('https://fonts.googleapis.com/css2?family=Playfair+Display:wght@600;700&family=Montserrat:wght@300;400;600&display=swap');
 
@@ -427,13 +732,17 @@ body > * {{
     """
 
     # --- Step 6: Assemble full HTML ---
+    fonts_link = "" if compact else (
+        "<!-- Google Fonts (if renderer supports them) -->\n    "
+        '<link href="https://fonts.googleapis.com/css2?family=Playfair+Display:wght@600;700'
+        '&family=Montserrat:wght@300;400;600&display=swap" rel="stylesheet">'
+    )
     html_full = f"""<!doctype html>
 <html lang="en">
   <head>
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width,initial-scale=1.0">
-    <!-- Google Fonts (if renderer supports them) -->
-    <link href="https://fonts.googleapis.com/css2?family=Playfair+Display:wght@600;700&family=Montserrat:wght@300;400;600&display=swap" rel="stylesheet">
+    {fonts_link}
     <style>{css}</style>
   </head>
   <body>
@@ -445,19 +754,97 @@ body > * {{
   </body>
 </html>
 """
+    return html_full, css
+
+
+def render_letter_pdf(html_full: str, css: str, pdf_path: str, profile: str = "standard") -> int:
+    """
+    Renders the letter HTML to `pdf_path` while holding a PDF_RENDER_CONCURRENCY slot.
+    The compact profile recompresses and downsamples images; its font savings come
+    from compact_letter_css using one system font family instead of the web fonts.
+    Returns the PDF size in bytes.
+    """
+    _, HTML, CSS = pdf_stack()
+    options = {}
+    if profile == "compact":
+        options = dict(optimize_images=True, jpeg_quality=PDF_JPEG_QUALITY, dpi=PDF_IMAGE_DPI)
+    with _render_slots:
+        with span("pdf.render", PDF_RENDER_SECONDS, profile=profile) as attrs:
+            document = HTML(string=html_full)
+            try:
+                document.write_pdf(pdf_path, stylesheets=[CSS(string=css)], **options)
+            except TypeError:
+                if not options:
+                    raise
+                # WeasyPrint < 59 has no per-option flags, only optimize_size
+                document.write_pdf(pdf_path, stylesheets=[CSS(string=css)], optimize_size=("fonts", "images"))
+            attrs["bytes"] = os.path.getsize(pdf_path)
+    observe(PDF_SIZE_BYTES, attrs["bytes"], profile=profile)
+    return attrs["bytes"]
+
+
+def format_letter_output(state: TenureAgentState) -> TenureAgentState:
+    """
+    Formats the reviewed letter (see refine_letter_markdown) and renders a professional, visually-rich PDF.
+    Header: elegant, red + black (Coca-Cola style) with a triangular separator (not a straight line),
+            dynamic logo / company name / address.
+    Footer: compact contact line.
+    Uses tasteful fonts (Playfair Display for headline, Montserrat for body) with fallbacks.
+    """
+    print("---NODE: FORMATTING LETTER OUTPUT (HTML + PDF)---")
 
-    # --- Step 7: Export to PDF (same approach as before) ---
-    output_dir = "files"
-    os.makedirs(output_dir, exist_ok=True)
-    pdf_path = f"{output_dir}/tenure_letter_{session_id}.pdf"
-    url_path= f"/tenure_letter_{session_id}.pdf"
+    data={
+        "letter_text": state["generated_letter_text"],
+        "message": "Please review and edit the generated offer letter.",
+    }
+    if state.get("auto_approve"):
+        # Batch runs skip the human review and keep the generated text as-is
+        state["user_reviewed_text"] = state["generated_letter_text"]
+    else:
+        from langgraph.types import interrupt
+        review = interrupt(data)
+        # /resume-letter-review sends {"user_reviewed_text": ..., "polish": ..., "render_profile": ..., "priority": ...}
+        if isinstance(review, dict):
+            # A human is waiting on this resume, even if the session started as a bulk batch item
+            state["priority"] = review.get("priority") or "interactive"
+            if review.get("polish") is not None:
+                state["llm_polish"] = bool(review["polish"])
+            if review.get("render_profile"):
+                state["render_profile"] = review["render_profile"]
+            review = review.get("user_reviewed_text")
+        state["user_reviewed_text"] = review
+
+
+    # --- Step 1: Refine the letter content (cached / rule-based, LLM polish on request) ---
+    final_text = state.get("user_reviewed_text") or state.get("generated_letter_text")
+    key_terms = [state.get(k) or "" for k in ("agency_name", "tenure", "fee", "joining_date", "client_name")]
+    polish = state.get("llm_polish", LLM_POLISH_DEFAULT)
+
+    state["formatted_letter_text"] = refine_letter_markdown(final_text, key_terms, polish=polish,
+                                                            priority=state.get("priority", "interactive"))
+    formatted_md = state["formatted_letter_text"]
+
+    # --- Steps 2-6: Build the branded HTML document ---
+    profile = resolve_render_profile(state.get("render_profile"))
+    html_full, css = build_letter_html(state, formatted_md, profile)
+    session_id = state.get("session_id", "unknown")
+
+    # --- Step 7: Export to PDF and commit it to the artifact store ---
+    store = get_store()
+    pdf_name = f"tenure_letter_{session_id}.pdf"
+    tmp_path = store.new_temp_path(".pdf")
     # Note: Some HTML->PDF renderers may not fetch Google fonts by default.
     # If your renderer has trouble, provide local font files or preload fonts into the renderer.
-    HTML(string=html_full).write_pdf(pdf_path, stylesheets=[CSS(string=css)])
-    print(f"✅ PDF generated (polished header & footer) at: {pdf_path}")
+    pdf_size = render_letter_pdf(html_full, css, str(tmp_path), profile)
+    artifact = store.commit(tmp_path, pdf_name, session_id=session_id)
+    print(f"✅ PDF generated ({profile} profile, {pdf_size / 1024:.1f} KiB) at: {artifact.path}")
     base_url = "https://createos.vercel.app/admin/contract/view"
 
-    state["pdf_path"] = f"{base_url}/{pdf_path}"
+    # Public URL is unchanged: /files/<name> resolves through the store
+    state["pdf_path"] = f"{base_url}/files/{pdf_name}"
+    state["pdf_file"] = str(artifact.path)
+    state["render_profile"] = profile
+    state["pdf_size_bytes"] = pdf_size
     return state
 
 
@@ -481,7 +868,7 @@ def generate_email_draft(state: TenureAgentState) -> TenureAgentState:
 
     The email should be professional, polite, and reference the attached PDF.
     """
-    response = llm.invoke(prompt)
+    response = invoke_llm(prompt, "email", state.get("priority", "interactive"))
     state["email_draft"] = response.content.strip()
     return state
 
@@ -517,28 +904,53 @@ def return_response(state: TenureAgentState) -> TenureAgentState:
     return state
 
 # --- Build Graph Flow ---
-memory = MemorySaver()
-workflow = StateGraph(TenureAgentState)
-
-workflow.add_node("collect_tenure_data", collect_tenure_data)
-workflow.add_node("validate_tenure_data", validate_tenure_data)
-workflow.add_node("compose_tenure_template", compose_tenure_template)
-workflow.add_node("generate_tenure_letter", generate_tenure_letter)
-workflow.add_node("format_letter_output", format_letter_output)
-workflow.add_node("generate_email_draft", generate_email_draft)
-workflow.add_node("attach_offer_pdf", attach_offer_pdf)
-workflow.add_node("return_response", return_response)
-
-workflow.set_entry_point("collect_tenure_data")
-workflow.add_edge("collect_tenure_data", "validate_tenure_data")
-workflow.add_edge("validate_tenure_data", "compose_tenure_template")
-workflow.add_edge("compose_tenure_template", "generate_tenure_letter")
-workflow.add_edge("generate_tenure_letter", "format_letter_output")
-workflow.add_edge("format_letter_output", "generate_email_draft")
-workflow.add_edge("generate_email_draft", "attach_offer_pdf")
-workflow.add_edge("attach_offer_pdf", "return_response")
-workflow.add_edge("return_response", END)
-
-agency_agent_app = workflow.compile(checkpointer=memory)
-
 
+_agent_app = None
+_agent_app_lock = threading.Lock()
+
+
+def build_agent_app():
+    from langgraph.graph import StateGraph, END
+    from langgraph.checkpoint.memory import MemorySaver
+
+    memory = MemorySaver()
+    workflow = StateGraph(TenureAgentState)
+
+    workflow.add_node("collect_tenure_data", traced_node("collect_tenure_data", collect_tenure_data))
+    workflow.add_node("validate_tenure_data", traced_node("validate_tenure_data", validate_tenure_data))
+    workflow.add_node("compose_tenure_template", traced_node("compose_tenure_template", compose_tenure_template))
+    workflow.add_node("generate_tenure_letter", traced_node("generate_tenure_letter", generate_tenure_letter))
+    workflow.add_node("format_letter_output", traced_node("format_letter_output", format_letter_output))
+    workflow.add_node("generate_email_draft", traced_node("generate_email_draft", generate_email_draft))
+    workflow.add_node("attach_offer_pdf", traced_node("attach_offer_pdf", attach_offer_pdf))
+    workflow.add_node("return_response", traced_node("return_response", return_response))
+
+    workflow.set_entry_point("collect_tenure_data")
+    workflow.add_edge("collect_tenure_data", "validate_tenure_data")
+    workflow.add_edge("validate_tenure_data", "compose_tenure_template")
+    workflow.add_edge("compose_tenure_template", "generate_tenure_letter")
+    workflow.add_edge("generate_tenure_letter", "format_letter_output")
+    workflow.add_edge("format_letter_output", "generate_email_draft")
+    workflow.add_edge("generate_email_draft", "attach_offer_pdf")
+    workflow.add_edge("attach_offer_pdf", "return_response")
+    workflow.add_edge("return_response", END)
+
+    return workflow.compile(checkpointer=memory)
+
+
+def get_agent_app():
+    """Returns the compiled graph (one per process, so the MemorySaver is shared)."""
+    global _agent_app
+    if _agent_app is None:
+        with _agent_app_lock:
+            if _agent_app is None:
+                with timed_load("letter_graph"):
+                    _agent_app = build_agent_app()
+    return _agent_app
+
+
+def __getattr__(name):
+    # Keeps `from agent import agency_agent_app` working without compiling at import time
+    if name == "agency_agent_app":
+        return get_agent_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,272 @@
+import os, re, time, shutil, sqlite3, hashlib, threading
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+# Content-addressed storage for generated and uploaded PDFs.
+#
+# Blobs live at <root>/objects/<h[:2]>/<h[2:4]>/<sha256><suffix>, so identical
+# renders are stored once and no directory grows with history. Public names
+# (tenure_letter_<session>.pdf, edited_<file>.pdf) are aliases kept in a small
+# SQLite index next to the blobs, which also drives retention GC.
+
+ARTIFACT_ROOT = os.getenv("ARTIFACT_ROOT", "files")
+ARTIFACT_RETENTION_DAYS = float(os.getenv("ARTIFACT_RETENTION_DAYS", "90"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(5 * 1024 ** 3)))
+ARTIFACT_GC_INTERVAL_S = int(os.getenv("ARTIFACT_GC_INTERVAL_S", "3600"))
+# Last-access times are kept in memory and written to the index at most this often
+ARTIFACT_ACCESS_FLUSH_S = float(os.getenv("ARTIFACT_ACCESS_FLUSH_S", "60"))
+
+_SESSION_NAME = re.compile(r"^tenure_letter_(\w+)\.pdf$")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (
+    digest   TEXT PRIMARY KEY,
+    path     TEXT NOT NULL,
+    size     INTEGER NOT NULL,
+    created  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS aliases (
+    name       TEXT PRIMARY KEY,
+    digest     TEXT NOT NULL REFERENCES objects(digest),
+    session_id TEXT,
+    created    REAL NOT NULL,
+    accessed   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aliases_digest ON aliases(digest);
+CREATE INDEX IF NOT EXISTS aliases_session ON aliases(session_id);
+CREATE INDEX IF NOT EXISTS aliases_accessed ON aliases(accessed);
+CREATE INDEX IF NOT EXISTS aliases_created ON aliases(created);
+"""
+
+
+@dataclass
+class Artifact:
+    name: str
+    digest: str
+    path: Path
+    size: int
+    session_id: str | None = None
+
+    @property
+    def url(self) -> str:
+        return f"/files/{self.name}"
+
+
+def file_digest(path) -> tuple[str, int]:
+    h = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+
+class ArtifactStore:
+    def __init__(self, root: str = ARTIFACT_ROOT):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.tmp_dir = self.root / ".tmp"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / ".index.sqlite3", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+
+        # name -> last access time, not yet written to the index (see _touch)
+        self._pending_access: dict[str, float] = {}
+        self._access_flushed = time.monotonic()
+
+    # ---------- writes ----------
+
+    def new_temp_path(self, suffix: str = ".pdf") -> Path:
+        """Scratch path on the store's filesystem, so commits are an atomic rename."""
+        return self.tmp_dir / f"{os.getpid()}_{threading.get_ident()}_{time.time_ns()}{suffix}"
+
+    def object_path(self, digest: str, suffix: str = ".pdf") -> Path:
+        return self.objects_dir / digest[:2] / digest[2:4] / f"{digest}{suffix}"
+
+    def commit(self, tmp_path, name: str, session_id: str | None = None,
+               digest: str | None = None, size: int | None = None, created: float | None = None) -> Artifact:
+        """
+        Moves `tmp_path` into the store under its content hash and points `name` at it.
+        If the same content is already stored the temp file is dropped (dedupe).
+        `created` backdates the name (for imported files); default: now.
+        """
+        tmp_path = Path(tmp_path)
+        if digest is None or size is None:
+            digest, size = file_digest(tmp_path)
+        target = self.object_path(digest, tmp_path.suffix)
+
+        now = created or time.time()
+        # Under the lock so GC can't drop a blob between the dedupe check and the alias insert
+        with self._lock:
+            if target.exists():
+                tmp_path.unlink(missing_ok=True)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, target)
+
+            self._db.execute(
+                "INSERT OR IGNORE INTO objects(digest, path, size, created) VALUES (?, ?, ?, ?)",
+                (digest, str(target), size, now),
+            )
+            self._db.execute(
+                "INSERT INTO aliases(name, digest, session_id, created, accessed) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(name) DO UPDATE SET digest=excluded.digest, session_id=excluded.session_id, "
+                "created=excluded.created, accessed=excluded.accessed",
+                (name, digest, session_id, now, now),
+            )
+            self._pending_access.pop(name, None)
+            self._db.commit()
+        return Artifact(name=name, digest=digest, path=target, size=size, session_id=session_id)
+
+    def put_file(self, path, name: str, session_id: str | None = None, created: float | None = None) -> Artifact:
+        """Stores a file that was written outside the store (the file is moved or removed)."""
+        path = Path(path)
+        if path.parent != self.tmp_dir:
+            tmp = self.new_temp_path(path.suffix)
+            shutil.move(path, tmp)
+            path = tmp
+        return self.commit(path, name, session_id, created=created)
+
+    def import_legacy(self, *dirs) -> int:
+        """
+        Moves flat PDFs from before the store (the store root itself, plus `dirs`,
+        e.g. generated_pdfs/) into it under their file name, dated by mtime, so
+        retention GC covers them. Names already in the index are left alone.
+        Returns the number of files imported.
+        """
+        imported = 0
+        for directory in (self.root, *map(Path, dirs)):
+            if not directory.is_dir():
+                continue
+            for path in directory.iterdir():
+                if path.name.startswith(".") or path.suffix.lower() != ".pdf" or not path.is_file():
+                    continue
+                with self._lock:
+                    known = self._db.execute("SELECT 1 FROM aliases WHERE name = ?", (path.name,)).fetchone()
+                if known:
+                    continue
+                session = _SESSION_NAME.match(path.name)
+                try:
+                    self.put_file(path, path.name, session.group(1) if session else None,
+                                  created=path.stat().st_mtime)
+                    imported += 1
+                except OSError as e:
+                    print(f"Artifact import skipped {path}: {e}")
+        if imported:
+            print(f"📦 Imported {imported} legacy PDFs into the artifact store")
+        return imported
+
+    # ---------- reads ----------
+
+    def resolve(self, name: str) -> Path | None:
+        """Path for a public name, or None. Files from before the store are still found."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT o.path FROM aliases a JOIN objects o ON o.digest = a.digest WHERE a.name = ?",
+                (name,),
+            ).fetchone()
+            if row:
+                self._touch(name)
+        if row and os.path.exists(row[0]):
+            return Path(row[0])
+
+        legacy = self.root / name
+        if not name.startswith(".") and legacy.is_file():
+            return legacy
+        return None
+
+    def _touch(self, name: str) -> None:
+        # Caller holds the lock. Access times only order LRU eviction, so they are
+        # batched into one write per ARTIFACT_ACCESS_FLUSH_S instead of one per download.
+        self._pending_access[name] = time.time()
+        if time.monotonic() - self._access_flushed >= ARTIFACT_ACCESS_FLUSH_S:
+            self._flush_access()
+
+    def _flush_access(self) -> None:
+        # Caller holds the lock
+        if self._pending_access:
+            self._db.executemany("UPDATE aliases SET accessed = ? WHERE name = ?",
+                                 [(ts, name) for name, ts in self._pending_access.items()])
+            self._db.commit()
+            self._pending_access.clear()
+        self._access_flushed = time.monotonic()
+
+    def session_artifacts(self, session_id: str) -> list[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT name FROM aliases WHERE session_id = ?", (session_id,)).fetchall()
+        return [r[0] for r in rows]
+
+    def total_size(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    # ---------- retention ----------
+
+    def gc(self, max_age_days: float = ARTIFACT_RETENTION_DAYS, max_bytes: int = ARTIFACT_MAX_BYTES) -> dict:
+        """
+        Drops names older than `max_age_days`, then least recently accessed names
+        until the store fits in `max_bytes`. Blobs with no remaining names are deleted.
+        """
+        now = time.time()
+        with self._lock:
+            self._flush_access()
+            expired = self._db.execute(
+                "DELETE FROM aliases WHERE created < ?", (now - max_age_days * 86400,)
+            ).rowcount
+            removed_bytes = self._drop_orphans()
+
+            evicted = 0
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+            while total > max_bytes:
+                row = self._db.execute("SELECT name, digest FROM aliases ORDER BY accessed LIMIT 1").fetchone()
+                if not row:
+                    break
+                self._db.execute("DELETE FROM aliases WHERE name = ?", (row[0],))
+                evicted += 1
+                freed = self._drop_orphans(row[1])
+                removed_bytes += freed
+                total -= freed
+            self._db.commit()
+
+        # Leftovers from crashed or abandoned writes
+        for tmp in self.tmp_dir.iterdir():
+            try:
+                if now - tmp.stat().st_mtime > 3600:
+                    tmp.unlink()
+            except OSError:
+                pass
+
+        stats = {"expired": expired, "evicted": evicted, "removed_bytes": removed_bytes}
+        if expired or evicted:
+            print(f"🗑️ Artifact GC: {stats}")
+        return stats
+
+    def _drop_orphans(self, digest: str | None = None) -> int:
+        # Deletes blobs no name points to; limited to one digest when given
+        query = "SELECT digest, path, size FROM objects o WHERE NOT EXISTS (SELECT 1 FROM aliases a WHERE a.digest = o.digest)"
+        params = ()
+        if digest is not None:
+            query += " AND o.digest = ?"
+            params = (digest,)
+        rows = self._db.execute(query, params).fetchall()
+        freed = 0
+        for digest, path, size in rows:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM objects WHERE digest = ?", (digest,))
+            freed += size
+        return freed
+
+
+@lru_cache(maxsize=None)
+def get_store() -> ArtifactStore:
+    return ArtifactStore()
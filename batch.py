@@ -0,0 +1,121 @@
+import asyncio, io, json, os, uuid, zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Sessions in flight per batch request; LLM and PDF render caps live in agent.py
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+# Own pool so batch sessions never starve the default pool used by interactive requests
+_batch_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_CONCURRENCY, thread_name_prefix="batch")
+
+
+def parse_batch_payload(raw: bytes) -> list[dict]:
+    """Accepts either a JSON array of offer requests or JSONL (one request per line)."""
+    text = raw.decode("utf-8").strip()
+    if not text:
+        raise ValueError("Empty batch payload")
+    if text.startswith("["):
+        items = json.loads(text)
+    else:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    if not all(isinstance(item, dict) for item in items):
+        raise ValueError("Each batch item must be a JSON object")
+    return items
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable buffer so ZipFile emits entries as a stream."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _run_session_sync(inputs: dict, auto_approve: bool) -> dict:
+    from agent import get_agent_app
+    agency_agent_app = get_agent_app()
+
+    session_id = uuid.uuid4().hex[:8]
+    config = {"configurable": {"thread_id": session_id}}
+    state = {**inputs, "session_id": session_id, "auto_approve": auto_approve,
+             "priority": "bulk"}
+
+    print(f"Starting batch letter generation session: {session_id}")
+    response = agency_agent_app.invoke(state, config)
+    checkpoint_id = agency_agent_app.get_state(config).config["configurable"]["checkpoint_id"]
+    return {"session_id": session_id, "checkpoint_id": checkpoint_id, "state": response}
+
+
+async def run_session(inputs: dict, auto_approve: bool = False) -> dict:
+    """Runs one letter session on the batch thread pool; errors are returned, not raised."""
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_batch_executor, _run_session_sync, inputs, auto_approve)
+    except Exception as e:
+        print(f"Error in batch letter session: {e}")
+        return {"error": str(e)}
+
+
+def _write_result(zf: zipfile.ZipFile, index: int, result: dict) -> dict:
+    prefix = f"{index:04d}"
+    if "error" in result:
+        zf.writestr(f"{prefix}_error.txt", result["error"])
+        return {"index": index, "status": "error", "error": result["error"]}
+
+    state = result["state"]
+    session_id = result["session_id"]
+    prefix = f"{prefix}_{session_id}"
+    entry = {"index": index, "session_id": session_id, "checkpoint_id": result["checkpoint_id"]}
+
+    pdf_file = state.get("pdf_file")
+    if pdf_file and os.path.exists(pdf_file):
+        # PDFs are already compressed, store them as-is
+        zf.write(pdf_file, f"{prefix}/tenure_letter_{session_id}.pdf", compress_type=zipfile.ZIP_STORED)
+        zf.writestr(f"{prefix}/email_draft.md", state.get("email_draft") or "")
+        entry["status"] = "completed"
+        entry["pdf_size_bytes"] = state.get("pdf_size_bytes")
+    else:
+        # Paused at the review interrupt: ship the draft so it can be resumed later
+        zf.writestr(f"{prefix}/letter_draft.md", state.get("generated_letter_text") or "")
+        entry["status"] = "awaiting_review"
+    return entry
+
+
+async def stream_batch_zip(items: list[dict], auto_approve: bool = False, concurrency: int = BATCH_CONCURRENCY):
+    """
+    Runs every item as its own session and yields ZIP bytes as each one finishes.
+    The archive ends with a manifest.json describing every session.
+    """
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, BATCH_MAX_CONCURRENCY)))
+
+    async def run(index: int, inputs: dict):
+        async with semaphore:
+            return index, await run_session(inputs, auto_approve)
+
+    sink = _ZipSink()
+    manifest = []
+    tasks = [asyncio.create_task(run(i, item)) for i, item in enumerate(items)]
+    try:
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for next_done in asyncio.as_completed(tasks):
+                index, result = await next_done
+                manifest.append(_write_result(zf, index, result))
+                yield sink.drain()
+            manifest.sort(key=lambda e: e["index"])
+            zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+        yield sink.drain()
+    finally:
+        # Client disconnected or failed mid-stream: stop queued sessions
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,273 @@
+"""
+Offline component benchmarks.
+
+    python bench.py                          # run everything, compare with bench_baseline.json if present
+    python bench.py --only nodes,render      # subset: nodes, render, probe, video, timeline
+    python bench.py --save-baseline          # record the current numbers as the baseline
+    python bench.py --repeat 20 --json out.json
+
+The Gemini client is replaced by fakes.FakeChatModel and video fixtures are
+generated locally with ffmpeg's lavfi testsrc, so no network or API key is needed.
+Each case runs in its own subprocess and reports p50/p95 wall time, mean CPU
+time (the process plus ffmpeg children) and that process's peak RSS, so one
+case's memory high-water mark never shows up in another's row. Exit status is 1 when a case's p50 regresses past the
+tolerance against the baseline.
+"""
+import os, sys, json, time, shutil, argparse, resource, statistics, subprocess, tempfile
+
+# Keep benchmark artifacts out of the real store; must be set before agent is imported
+os.environ.setdefault("ARTIFACT_ROOT", tempfile.mkdtemp(prefix="clipfox_bench_"))
+
+from fakes import FakeChatModel, make_test_video
+from harness import percentile, set_llm_limits
+
+# Time the nodes, not the LLM gateway's quota waits
+set_llm_limits()
+
+BASELINE_PATH = "bench_baseline.json"
+
+RESOLUTIONS = [(640, 360), (1280, 720), (1920, 1080)]
+TRIM_LENGTHS = [2.0, 5.0]
+FIXTURE_SECONDS = 6.0
+
+SAMPLE_STATE = {
+    "agency_name": "Skyline Media",
+    "tenure": "12 months",
+    "fee": "$1500 per month",
+    "requirement_list": ["Social media management", "Monthly analytics report", "Two campaign shoots"],
+    "joining_date": "October 15, 2025",
+    "client_name": "Acme Corp",
+    "company_name": "Creativity Unleashed",
+    "company_email": "hello@creativity.example",
+    "company_mobile": "+91 90000 00000",
+    "session_id": "bench000",
+    "user_reviewed_text": "",
+    "auto_approve": True,
+}
+
+
+# ======================================================
+# Measurement
+# ======================================================
+
+def _children_cpu() -> float:
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return ru.ru_utime + ru.ru_stime
+
+
+def _peak_rss_mb() -> float:
+    # Lifetime high-water mark of this process and its children, hence one process per case.
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return max(own, children)
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    """Runs `fn` warmup + repeat times; returns timings in milliseconds."""
+    for _ in range(warmup):
+        fn()
+    walls, cpus = [], []
+    for _ in range(repeat):
+        cpu0 = time.process_time() + _children_cpu()
+        t0 = time.perf_counter()
+        fn()
+        walls.append((time.perf_counter() - t0) * 1000)
+        cpus.append((time.process_time() + _children_cpu() - cpu0) * 1000)
+    return {
+        "p50_ms": round(percentile(walls, 50), 3),
+        "p95_ms": round(percentile(walls, 95), 3),
+        "cpu_ms": round(statistics.mean(cpus), 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "runs": repeat,
+    }
+
+
+# ======================================================
+# Cases
+# ======================================================
+
+def node_cases(agent):
+    """One case per graph node, each fed the state the previous node produced."""
+    order = [
+        ("collect_tenure_data", agent.collect_tenure_data),
+        ("validate_tenure_data", agent.validate_tenure_data),
+        ("compose_tenure_template", agent.compose_tenure_template),
+        ("generate_tenure_letter", agent.generate_tenure_letter),
+        ("format_letter_output", agent.format_letter_output),
+        ("generate_email_draft", agent.generate_email_draft),
+        ("attach_offer_pdf", agent.attach_offer_pdf),
+        ("return_response", agent.return_response),
+    ]
+    state = dict(SAMPLE_STATE)
+    for name, node in order:
+        before = dict(state)
+        yield f"node.{name}", (lambda node=node, before=before: node(dict(before)))
+        state = node(dict(before))
+
+
+def render_cases(agent):
+    state = dict(SAMPLE_STATE)
+    for node in (agent.compose_tenure_template, agent.generate_tenure_letter):
+        state = node(state)
+    formatted_md = agent.refine_letter_markdown(state["generated_letter_text"])
+    html_full, css = agent.build_letter_html(state, formatted_md)
+    compact_html, compact_css = agent.build_letter_html(state, formatted_md, "compact")
+    out = os.path.join(tempfile.gettempdir(), "clipfox_bench_render.pdf")
+
+    yield "render.build_html", lambda: agent.build_letter_html(state, formatted_md)
+    yield "render.weasyprint", lambda: agent.render_letter_pdf(html_full, css, out)
+    yield "render.weasyprint_compact", lambda: agent.render_letter_pdf(compact_html, compact_css, out, "compact")
+
+
+def probe_cases(ffmpeg_func):
+    for w, h in RESOLUTIONS:
+        path = str(make_test_video(w, h, FIXTURE_SECONDS))
+        yield f"probe.{w}x{h}", (lambda path=path: ffmpeg_func.get_video_info(path))
+
+
+def video_cases(ffmpeg_func):
+    out = os.path.join(tempfile.gettempdir(), "clipfox_bench_out.mp4")
+    for w, h in RESOLUTIONS:
+        path = str(make_test_video(w, h, FIXTURE_SECONDS))
+        crop = (w // 8, h // 8, w * 3 // 4, h * 3 // 4)
+        resize = (w // 2 // 2 * 2, h // 2 // 2 * 2)
+        for trim in TRIM_LENGTHS:
+            yield (f"process_video.{w}x{h}.trim{trim:g}s",
+                   lambda path=path, crop=crop, resize=resize, trim=trim:
+                   ffmpeg_func.process_video(path, out, crop, resize, (0.5, 0.5 + trim)))
+
+
+def timeline_cases(ffmpeg_func):
+    """Cuts and a transition in one graph: concat output feeding xfade, plus a shared source."""
+    out = os.path.join(tempfile.gettempdir(), "clipfox_bench_timeline.mp4")
+    wide = str(make_test_video(1280, 720, FIXTURE_SECONDS))
+    small = str(make_test_video(640, 360, FIXTURE_SECONDS))
+    sources = {path: ffmpeg_func.probe_source(path) for path in (wide, small)}
+    clips = [
+        {"source": wide, "trim": (0.0, 2.0)},
+        {"source": wide, "trim": (2.5, 4.0), "crop": (160, 90, 960, 540)},
+        {"source": small, "trim": (0.0, 2.0), "transition": "fade", "transition_duration": 0.5},
+        {"source": wide, "trim": (4.0, 5.5)},
+    ]
+    yield "timeline.cuts_and_fade.720p", lambda: ffmpeg_func.render_timeline(clips, sources, out, (1280, 720))
+
+
+def collect_cases(groups: set[str]):
+    """Yields (group, case_name, fn); a group whose dependencies are missing is skipped."""
+    if groups & {"nodes", "render"}:
+        try:
+            import agent
+            agent.llm = FakeChatModel()
+            agent.pdf_stack()
+        except Exception as e:
+            print(f"⚠️ Skipping nodes/render: {e}")
+        else:
+            if "nodes" in groups:
+                yield from (("nodes", n, f) for n, f in node_cases(agent))
+            if "render" in groups:
+                yield from (("render", n, f) for n, f in render_cases(agent))
+
+    if groups & {"probe", "video", "timeline"}:
+        if not shutil.which("ffmpeg") or not shutil.which("ffprobe"):
+            print("⚠️ Skipping probe/video: ffmpeg/ffprobe not found on PATH")
+            return
+        import ffmpeg_func
+        if "probe" in groups:
+            yield from (("probe", n, f) for n, f in probe_cases(ffmpeg_func))
+        if "video" in groups:
+            yield from (("video", n, f) for n, f in video_cases(ffmpeg_func))
+        if "timeline" in groups:
+            yield from (("timeline", n, f) for n, f in timeline_cases(ffmpeg_func))
+
+
+RESULT_MARKER = "BENCH_RESULT "
+
+
+def run_case_isolated(group: str, name: str, repeat: int) -> dict:
+    """Measures one case in a fresh interpreter (see --case) so its peak RSS is its own."""
+    cmd = [sys.executable, os.path.abspath(__file__), "--only", group, "--case", name, "--repeat", str(repeat)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    raise RuntimeError(f"{name} failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+# ======================================================
+# Baseline comparison
+# ======================================================
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = res["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0
+        res["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: p50 {base['p50_ms']:.1f} → {res['p50_ms']:.1f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def print_table(results: dict) -> None:
+    print(f"\n{'case':<44}{'p50 ms':>10}{'p95 ms':>10}{'cpu ms':>10}{'rss MB':>9}{'vs base':>9}")
+    for name, r in results.items():
+        vs = f"{r['vs_baseline']:.2f}x" if "vs_baseline" in r else "-"
+        print(f"{name:<44}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['cpu_ms']:>10.2f}{r['peak_rss_mb']:>9.1f}{vs:>9}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ClipFox component benchmarks")
+    parser.add_argument("--only", default="nodes,render,probe,video,timeline", help="comma-separated groups")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="allowed p50 slowdown, e.g. 0.2 = 20%%")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--case", help=argparse.SUPPRESS)  # internal: measure one case in this process
+    args = parser.parse_args()
+
+    groups = {g.strip() for g in args.only.split(",") if g.strip()}
+    if args.case:
+        for _, name, fn in collect_cases(groups):
+            if name == args.case:
+                print(RESULT_MARKER + json.dumps(measure(fn, args.repeat)))
+                return 0
+        print(f"Unknown case: {args.case}", file=sys.stderr)
+        return 2
+
+    results = {}
+    for group, name, _ in collect_cases(groups):
+        # ffmpeg cases are slow, so fewer repetitions
+        repeat = max(3, args.repeat // 3) if group in ("video", "timeline") else args.repeat
+        print(f"▶ {name}")
+        results[name] = run_case_isolated(group, name, repeat)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    print_table(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if regressions:
+        print("\n❌ Regressions:")
+        for line in regressions:
+            print(f"   {line}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
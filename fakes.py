@@ -0,0 +1,160 @@
+import os, time, random, hashlib, threading
+from pathlib import Path
+
+# Offline stand-ins used by bench.py and loadtest.py:
+# a deterministic chat model in place of ChatGoogleGenerativeAI and locally
+# generated (ffmpeg lavfi testsrc) video fixtures.
+
+FIXTURE_DIR = Path(os.getenv("BENCH_FIXTURE_DIR", "/tmp/clipfox_fixtures"))
+
+_TEMPLATE = """Dear [Client Name],
+
+We are pleased to offer [Agency] services for a tenure of [Tenure] at a fee of [Fee].
+
+Terms and Conditions:
+- [Requirement]
+
+Joining Date: [Joining Date]
+
+Sincerely,
+[Company Name]
+"""
+
+_LETTER = """{company}
+{email} | {mobile}
+
+Dear {client},
+
+SUBJECT: SERVICE TENURE OFFER
+
+We are pleased to confirm that {agency} will provide services to {client} for a tenure of {tenure}, at a fee of {fee}. This letter sets out the terms of our engagement and what you can expect from our team over the coming months.
+
+Scope of Services:
+{requirements}
+
+Our team will share a detailed onboarding plan during the first week, followed by monthly progress reports and a quarterly review. Any change to the scope will be agreed in writing before work begins.
+
+Joining Date: {joining_date}
+Fee: {fee}
+Tenure: {tenure}
+
+Please sign and return a copy of this letter to confirm your acceptance. We look forward to a long and productive partnership.
+
+Sincerely,
+{company}
+"""
+
+_EMAIL = """Subject: Service Tenure Offer - {agency}
+
+Dear {client},
+
+Please find attached our tenure offer letter for a {tenure} engagement at {fee}, starting {joining_date}.
+
+Let us know if you have any questions.
+
+Best regards,
+{company}
+"""
+
+
+class FakeMessage:
+    def __init__(self, content: str, input_tokens: int, output_tokens: int):
+        self.content = content
+        self.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+
+def _field(prompt: str, label: str, default: str) -> str:
+    for line in prompt.splitlines():
+        key, _, value = line.strip().partition(":")
+        if key.strip().lower() == label.lower() and value.strip():
+            return value.strip()
+    return default
+
+
+class FakeChatModel:
+    """
+    Deterministic drop-in for the chat model's `invoke(prompt)`.
+    Answers by prompt type (template / letter / refine / email) with text built
+    from the prompt's fields. `latency` is a fixed number of seconds or a
+    callable returning one (e.g. a sampled distribution); `fail_rate` raises
+    a transient error on that share of calls.
+    """
+
+    def __init__(self, latency=0.0, fail_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _respond(self, prompt: str) -> str:
+        fields = dict(
+            agency=_field(prompt, "Agency", "Skyline Media"),
+            tenure=_field(prompt, "Tenure", "12 months"),
+            fee=_field(prompt, "Fee", "$1500 per month"),
+            joining_date=_field(prompt, "Joining Date", "October 15, 2025"),
+            client=_field(prompt, "client name", "Acme Corp"),
+            company=_field(prompt, "our company email", "Creativity Unleashed"),
+            email="hello@example.com",
+            mobile="+91 90000 00000",
+        )
+        reqs = _field(prompt, "Requirements", "Social media management, Monthly reporting")
+        fields["requirements"] = "\n".join(f"- {r.strip()}" for r in reqs.split(",") if r.strip())
+
+        if "email draft" in prompt.lower():
+            return _EMAIL.format(**fields)
+        if "Refine the following letter" in prompt:
+            letter = prompt.split("Letter:", 1)[-1].strip()
+            return letter.replace("SUBJECT:", "### Subject:")
+        if "Template:" in prompt:
+            return _LETTER.format(**fields)
+        return _TEMPLATE
+
+    def invoke(self, prompt, *args, **kwargs):
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.fail_rate
+        delay = self.latency() if callable(self.latency) else self.latency
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise TimeoutError("Fake transient LLM failure")
+        content = self._respond(prompt).strip()
+        return FakeMessage(content, input_tokens=len(prompt) // 4, output_tokens=len(content) // 4)
+
+
+def lognormal_latency(median_s: float, sigma: float = 0.5, seed: int = 0):
+    """Latency sampler with a realistic long tail, for FakeChatModel(latency=...)."""
+    import math
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def sample() -> float:
+        with lock:
+            return rng.lognormvariate(math.log(median_s), sigma)
+    return sample
+
+
+def make_test_video(width: int, height: int, seconds: float, fps: int = 30, directory: Path = FIXTURE_DIR) -> Path:
+    """Generates (once) an H.264/AAC test clip with ffmpeg's lavfi testsrc and a sine tone."""
+    import ffmpeg
+
+    directory.mkdir(parents=True, exist_ok=True)
+    key = hashlib.sha1(f"{width}x{height}@{fps}:{seconds}".encode()).hexdigest()[:10]
+    path = directory / f"testsrc_{width}x{height}_{seconds:g}s_{key}.mp4"
+    if path.exists():
+        return path
+
+    video = ffmpeg.input(f"testsrc=size={width}x{height}:rate={fps}:duration={seconds}", f="lavfi")
+    audio = ffmpeg.input(f"sine=frequency=440:sample_rate=48000:duration={seconds}", f="lavfi")
+    tmp = path.with_suffix(".partial.mp4")
+    stream = ffmpeg.output(video, audio, str(tmp), vcodec="libx264", preset="ultrafast",
+                           pix_fmt="yuv420p", acodec="aac", shortest=None)
+    ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+    os.replace(tmp, path)
+    return path
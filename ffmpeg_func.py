@@ -2,6 +2,25 @@ import ffmpeg
 import requests
 from typing import Optional
 import os
+
+# Output settings shared by every encode (single clips and timelines)
+ENCODE_KWARGS = {
+    'vcodec': 'libx264',
+    'preset': 'medium',
+    'crf': 23,
+    'acodec': 'aac',
+    'audio_bitrate': '128k',
+    'movflags': '+faststart'
+}
+
+# Transitions between timeline clips: a hard cut (concat) or an xfade transition
+XFADE_TRANSITIONS = ("fade", "dissolve", "wipeleft", "wiperight", "slideleft", "slideright")
+
+# Clips of one source share a decoded input only when each starts at most this
+# many seconds after the previous one ends (and later in the source); otherwise
+# the gap would be decoded for nothing or frames would queue behind concat
+TIMELINE_SHARE_GAP_S = float(os.getenv("TIMELINE_SHARE_GAP_S", "5"))
+
 def download_video(api_url: str, filename: str) -> str:
     """Download video from API endpoint"""
     print(f"Downloading from: {api_url}")
@@ -77,14 +96,7 @@ def process_video(
             input_stream = ffmpeg.input(input_file)
         
         # Build output
-        output_kwargs = {
-            'vcodec': 'libx264',
-            'preset': 'medium',
-            'crf': 23,
-            'acodec': 'aac',
-            'audio_bitrate': '128k',
-            'movflags': '+faststart'
-        }
+        output_kwargs = dict(ENCODE_KWARGS)
         
         if vf:
             output_kwargs['vf'] = vf
@@ -100,6 +112,186 @@ def process_video(
         print(f"❌ FFmpeg error: {error_msg}")
         raise Exception(f"Video processing failed: {error_msg}")
 
+def probe_source(filename: str) -> dict:
+    """Get dimensions, duration and whether there is an audio track"""
+    probe = ffmpeg.probe(filename)
+    video_stream = next((s for s in probe['streams'] if s['codec_type'] == 'video'), None)
+    if not video_stream:
+        raise Exception(f"No video stream found in {filename}")
+    return {
+        'path': filename,
+        'width': int(video_stream['width']),
+        'height': int(video_stream['height']),
+        'duration': float(probe['format']['duration']),
+        'has_audio': any(s['codec_type'] == 'audio' for s in probe['streams']),
+    }
+
+
+def _even(value: int) -> int:
+    return max(2, int(value) // 2 * 2)
+
+
+def _clip_range(clip: dict, info: dict) -> tuple[float, float]:
+    start, end = clip.get('trim') or (0.0, None)
+    if start < 0 or (end is not None and end < 0):
+        raise ValueError(f"Negative trim {start}-{end}s for {info['path']}")
+    end = info['duration'] if end is None else min(end, info['duration'])
+    if end - start <= 0:
+        raise ValueError(f"Empty trim {start}-{end}s for {info['path']}")
+    return float(start), float(end)
+
+
+def _clip_crop(clip: dict, info: dict) -> Optional[tuple]:
+    if not clip.get('crop'):
+        return None
+    x, y, w, h = clip['crop']
+    if x < 0 or y < 0 or x >= info['width'] or y >= info['height'] or w <= 0 or h <= 0:
+        raise ValueError(f"Crop {clip['crop']} is outside the {info['width']}x{info['height']} source")
+    return x, y, min(w, info['width'] - x), min(h, info['height'] - y)
+
+
+def _input_groups(clips: list[dict], ranges: list[tuple]) -> list[list[int]]:
+    """Groups clip indices that can share one seeked input (same source, close and in order)."""
+    groups, open_group = [], {}
+    for i, clip in enumerate(clips):
+        group = open_group.get(clip['source'])
+        if group is not None:
+            gap = ranges[i][0] - ranges[group[-1]][1]
+            if 0 <= gap <= TIMELINE_SHARE_GAP_S:
+                group.append(i)
+                continue
+        group = [i]
+        groups.append(group)
+        open_group[clip['source']] = group
+    return groups
+
+
+def _canvas_size(clip: dict, info: dict) -> tuple[int, int]:
+    if clip.get('resize'):
+        return _even(clip['resize'][0]), _even(clip['resize'][1])
+    crop = _clip_crop(clip, info)
+    if crop:
+        return _even(crop[2]), _even(crop[3])
+    return _even(info['width']), _even(info['height'])
+
+
+def build_timeline(clips: list[dict], sources: dict[str, dict], output_file: str,
+                   size: Optional[tuple] = None, fps: int = 30):
+    """
+    Compiles a list of clips into one ffmpeg filtergraph; returns (output stream, duration).
+
+    Each clip is a dict with `source` (key into `sources`, which maps to probe_source()
+    results), optional `trim` (start, end), `crop` (x, y, w, h) and `resize` (w, h), and
+    `transition` ("cut" or one of XFADE_TRANSITIONS) with `transition_duration`, describing
+    how the clip joins the previous one. Clips that follow each other closely in the same
+    source share one seeked input (split between them, so that span is decoded once);
+    other clips get their own seeked input. Clips are letterboxed onto a common canvas
+    (`size`, default: the first clip's size).
+    """
+    if not clips:
+        raise ValueError("Timeline has no clips")
+    if fps <= 0:
+        raise ValueError(f"Invalid frame rate {fps}")
+
+    ranges = [_clip_range(clip, sources[clip['source']]) for clip in clips]
+    width, height = size or _canvas_size(clips[0], sources[clips[0]['source']])
+    width, height = _even(width), _even(height)
+
+    # One seeked input per group of clips, limited to the span the group uses
+    video_parts, audio_parts, offsets = {}, {}, {}
+    for indices in _input_groups(clips, ranges):
+        info = sources[clips[indices[0]]['source']]
+        first, last = ranges[indices[0]][0], ranges[indices[-1]][1]
+        src = ffmpeg.input(info['path'], ss=first, t=last - first)
+        n = len(indices)
+        video = src.video.filter_multi_output('split', n) if n > 1 else None
+        audio = src.audio.filter_multi_output('asplit', n) if n > 1 and info['has_audio'] else None
+        for j, i in enumerate(indices):
+            offsets[i] = first
+            video_parts[i] = video[j] if video is not None else src.video
+            if info['has_audio']:
+                audio_parts[i] = audio[j] if audio is not None else src.audio
+
+    segments = []
+    for i, clip in enumerate(clips):
+        info = sources[clip['source']]
+        start, end = ranges[i]
+        duration = end - start
+        rel_start, rel_end = start - offsets[i], end - offsets[i]
+
+        v = video_parts[i].trim(start=rel_start, end=rel_end).setpts('PTS-STARTPTS')
+        crop = _clip_crop(clip, info)
+        if crop:
+            v = v.crop(*crop)
+        resize = clip.get('resize')
+        if resize and resize[0] <= width and resize[1] <= height:
+            v = v.filter('scale', _even(resize[0]), _even(resize[1]))
+        else:
+            v = v.filter('scale', width, height, force_original_aspect_ratio='decrease', force_divisible_by=2)
+        v = (v.filter('pad', width, height, '(ow-iw)/2', '(oh-ih)/2')
+              .filter('setsar', 1)
+              .filter('fps', fps=fps)
+              .filter('format', 'yuv420p')
+              # concat outputs AV_TIME_BASE; xfade needs both inputs on the same timebase
+              .filter('settb', 'AVTB'))
+
+        if i in audio_parts:
+            a = audio_parts[i].filter('atrim', start=rel_start, end=rel_end).filter('asetpts', 'PTS-STARTPTS')
+        else:
+            a = ffmpeg.input('anullsrc=channel_layout=stereo:sample_rate=48000', f='lavfi', t=duration).audio
+        # Pad/cut audio to the video length so concatenated clips stay in sync
+        a = (a.filter('aformat', sample_fmts='fltp', sample_rates=48000, channel_layouts='stereo')
+              .filter('apad')
+              .filter('atrim', duration=duration))
+        segments.append((v, a, duration))
+
+    def join_cuts(run):
+        if len(run) == 1:
+            return run[0][0], run[0][1]
+        joined = ffmpeg.concat(*[s for v, a, _ in run for s in (v, a)], v=1, a=1).node
+        return joined[0], joined[1]
+
+    # Hard cuts are concatenated in runs; an xfade transition closes the run so far
+    run, total = [segments[0]], segments[0][2]
+    for clip, segment in zip(clips[1:], segments[1:]):
+        transition = clip.get('transition') or 'cut'
+        if transition == 'cut':
+            run.append(segment)
+            total += segment[2]
+            continue
+        if transition not in XFADE_TRANSITIONS:
+            raise ValueError(f"Unknown transition: {transition}")
+        fade = clip.get('transition_duration')
+        fade = 0.5 if fade is None else float(fade)
+        if fade <= 0:
+            raise ValueError(f"Invalid transition duration {fade}s")
+        if fade >= min(total, segment[2]):
+            raise ValueError(f"Transition of {fade}s is longer than the clips it joins")
+        v, a = join_cuts(run)
+        v = ffmpeg.filter([v, segment[0]], 'xfade', transition=transition, duration=fade, offset=total - fade)
+        a = ffmpeg.filter([a, segment[1]], 'acrossfade', d=fade)
+        total += segment[2] - fade
+        run = [(v, a, total)]
+
+    v, a = join_cuts(run)
+    return ffmpeg.output(v, a, output_file, **ENCODE_KWARGS), total
+
+
+def render_timeline(clips: list[dict], sources: dict[str, dict], output_file: str,
+                    size: Optional[tuple] = None, fps: int = 30) -> float:
+    """Render a multi-clip timeline in a single encode pass; returns the output duration"""
+    print(f"Rendering timeline: {len(clips)} clips from {len(sources)} sources...")
+    try:
+        stream, duration = build_timeline(clips, sources, output_file, size, fps)
+        ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+        print("Timeline complete!")
+        return duration
+    except ffmpeg.Error as e:
+        error_msg = e.stderr.decode() if e.stderr else str(e)
+        print(f"❌ FFmpeg error: {error_msg}")
+        raise Exception(f"Timeline rendering failed: {error_msg}")
+
+
 def cleanup_files(*files):
     """Clean up temporary files"""
     for file in files:
@@ -0,0 +1,25 @@
+import os
+
+# Helpers shared by the offline harnesses (bench.py, loadtest.py).
+
+# The default gateway quota (LLM_RPM=60) would throttle the fake model within
+# seconds, so harness runs measure the app, not the quota, unless told otherwise.
+UNTHROTTLED_LLM_RPM = 1_000_000
+UNTHROTTLED_LLM_TPM = 1_000_000_000
+UNTHROTTLED_LLM_CONCURRENCY = 256
+
+
+def set_llm_limits(rpm: float = UNTHROTTLED_LLM_RPM, tpm: float = UNTHROTTLED_LLM_TPM,
+                   concurrency: int = UNTHROTTLED_LLM_CONCURRENCY) -> None:
+    """Sets the gateway limits for this process; must run before the gateway is first used."""
+    os.environ["LLM_RPM"] = str(rpm)
+    os.environ["LLM_TPM"] = str(tpm)
+    os.environ["LLM_CONCURRENCY"] = str(concurrency)
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Linear-interpolated percentile of `values` (pct in 0..100)."""
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
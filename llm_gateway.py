@@ -0,0 +1,270 @@
+import os, time, heapq, random, itertools, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metrics import observe, LLM_QUEUE_SECONDS, LLM_RETRIES, LLM_HEDGES, LLM_REJECTED
+
+# Admission control in front of the chat model.
+#
+# Every call waits for a slot in three limits -- requests/minute, tokens/minute
+# and in-flight calls -- in priority order (interactive review sessions before
+# bulk jobs), then runs with a per-attempt timeout inside an overall deadline.
+# Transient failures are retried with full-jitter exponential backoff, and an
+# interactive call that is slower than `hedge_after_s` gets a second, racing
+# request when the quota allows it.
+
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+_RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "InternalServerError",
+                    "TooManyRequests", "RateLimitError", "APITimeoutError", "APIConnectionError"}
+_RETRYABLE_TEXT = ("429", "RESOURCE_EXHAUSTED", "UNAVAILABLE", "503", "DEADLINE_EXCEEDED")
+_QUOTA_NAMES = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+
+
+class LLMGatewayError(Exception):
+    """Base for calls the gateway gave up on."""
+
+
+class LLMRateLimited(LLMGatewayError):
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMTimeout(LLMGatewayError):
+    pass
+
+
+class _AttemptTimeout(Exception):
+    pass
+
+
+def is_retryable(e: BaseException) -> bool:
+    if isinstance(e, (TimeoutError, ConnectionError, _AttemptTimeout)):
+        return True
+    for attr in ("status_code", "code"):
+        if getattr(e, attr, None) in _RETRYABLE_CODES:
+            return True
+    if type(e).__name__ in _RETRYABLE_NAMES:
+        return True
+    text = str(e)
+    return any(marker in text for marker in _RETRYABLE_TEXT)
+
+
+def is_quota_error(e: BaseException) -> bool:
+    if getattr(e, "status_code", None) == 429 or getattr(e, "code", None) == 429:
+        return True
+    return type(e).__name__ in _QUOTA_NAMES or "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e)
+
+
+class TokenBucket:
+    """Classic token bucket; `per_minute` tokens refill continuously up to `capacity`."""
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        # Reconciles an estimate with actual usage; may go negative (debt is paid by waiting)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class LLMGateway:
+    def __init__(self, model_factory, requests_per_minute: float = 60, tokens_per_minute: float = 1_000_000,
+                 max_concurrency: int = 8, max_retries: int = 3, base_backoff_s: float = 0.5,
+                 max_backoff_s: float = 20.0, deadline_s: float = 180.0, attempt_timeout_s: float = 90.0,
+                 hedge_after_s: float | None = None, expected_output_tokens: int = 1500):
+        """`model_factory` returns the chat model to call (looked up per call, so it can be swapped)."""
+        self._model_factory = model_factory
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff_s = base_backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.deadline_s = deadline_s
+        self.attempt_timeout_s = attempt_timeout_s
+        self.hedge_after_s = hedge_after_s
+        self.expected_output_tokens = expected_output_tokens
+
+        self._cond = threading.Condition()
+        self._waiting: list[tuple[int, int]] = []   # heap of (priority, ticket)
+        self._tickets = itertools.count()
+        self._in_flight = 0
+        # Room for a hedge next to every in-flight call; abandoned attempts finish in the background
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="llm")
+
+    # ---------- admission ----------
+
+    def _admit(self, cost: float, priority: str, deadline: float) -> None:
+        rank = PRIORITIES.get(priority, PRIORITIES["bulk"])
+        entry = (rank, next(self._tickets))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiting, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait_s = 0.05   # not at the head of the queue: re-check when woken or shortly
+                    at_head = self._waiting[0] == entry and self._in_flight < self.max_concurrency
+                    if at_head:
+                        wait_s = max(self.requests.wait_time(1, now), self.tokens.wait_time(cost, now))
+                        if wait_s == 0:
+                            self.requests.take(1)
+                            self.tokens.take(cost)
+                            self._in_flight += 1
+                            break
+                    if now >= deadline or (at_head and now + wait_s > deadline):
+                        LLM_REJECTED.labels(reason="quota").inc()
+                        raise LLMRateLimited("LLM quota or capacity exhausted before the call deadline",
+                                             retry_after=max(1.0, wait_s))
+                    self._cond.wait(timeout=min(wait_s, deadline - now))
+            finally:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+        observe(LLM_QUEUE_SECONDS, time.monotonic() - start, priority=priority)
+
+    def _release(self, actual_tokens: float | None, estimated: float) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if actual_tokens:
+                self.tokens.adjust(actual_tokens - estimated)
+            self._cond.notify_all()
+
+    def _try_take_hedge(self) -> bool:
+        with self._cond:
+            now = time.monotonic()
+            if self.requests.wait_time(1, now) == 0:
+                self.requests.take(1)
+                return True
+        return False
+
+    # ---------- calls ----------
+
+    def _attempt(self, prompt, timeout: float, hedge: bool, estimated: float):
+        """
+        Runs one attempt (plus an optional hedge). The in-flight slot taken by _admit
+        is released only when every request of the attempt has returned, so calls
+        abandoned after a timeout still count against max_concurrency and can never
+        fill the executor.
+        """
+        try:
+            model = self._model_factory()
+        except BaseException:
+            self._release(None, estimated)
+            raise
+
+        lock = threading.Lock()
+        outstanding = {"requests": 0, "tokens": 0}
+
+        def on_done(future):
+            if not future.cancelled() and future.exception() is None:
+                usage = getattr(future.result(), "usage_metadata", None) or {}
+                tokens = usage.get("total_tokens") or 0
+            else:
+                tokens = 0
+            with lock:
+                outstanding["requests"] -= 1
+                outstanding["tokens"] += tokens
+                last = outstanding["requests"] == 0
+            if last:
+                self._release(outstanding["tokens"], estimated)
+
+        def submit():
+            with lock:
+                outstanding["requests"] += 1
+            future = self._executor.submit(model.invoke, prompt)
+            future.add_done_callback(on_done)
+            return future
+
+        futures = [submit()]
+        end = time.monotonic() + timeout
+        if hedge and self.hedge_after_s is not None and self.hedge_after_s < timeout:
+            done, _ = wait(futures, timeout=self.hedge_after_s)
+            if not done and self._try_take_hedge():
+                LLM_HEDGES.inc()
+                futures.append(submit())
+
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        if error is not None and not pending:
+            raise error
+        raise _AttemptTimeout(f"LLM call exceeded {timeout:.1f}s")
+
+    def _give_up(self, e: Exception, retried: bool) -> Exception:
+        """Maps a failure the gateway won't retry to what callers see."""
+        if isinstance(e, _AttemptTimeout):
+            LLM_REJECTED.labels(reason="deadline").inc()
+            return LLMTimeout(str(e))
+        if not retried:
+            return e
+        # Transient errors that outlived the retries: quota/overload vs. slowness
+        if is_quota_error(e):
+            LLM_REJECTED.labels(reason="quota").inc()
+            return LLMRateLimited(f"LLM provider still rate limited after retries: {e}", retry_after=self.max_backoff_s)
+        LLM_REJECTED.labels(reason="retries").inc()
+        return LLMTimeout(f"LLM call still failing after retries: {type(e).__name__}: {e}")
+
+    def invoke(self, prompt, prompt_type: str = "other", priority: str = "interactive",
+               deadline_s: float | None = None):
+        """Calls the model under the gateway's limits; raises LLMRateLimited / LLMTimeout when it gives up."""
+        deadline = time.monotonic() + (deadline_s or self.deadline_s)
+        estimated = len(str(prompt)) / 4 + self.expected_output_tokens
+        attempt = 0
+        while True:
+            self._admit(estimated, priority, deadline)
+            try:
+                timeout = min(self.attempt_timeout_s, deadline - time.monotonic())
+                return self._attempt(prompt, timeout, hedge=(priority == "interactive"), estimated=estimated)
+            except Exception as e:
+                remaining = deadline - time.monotonic()
+                if not is_retryable(e) or attempt >= self.max_retries or remaining <= 0:
+                    error = self._give_up(e, retried=is_retryable(e))
+                    if error is e:
+                        raise
+                    raise error from e
+                backoff = random.uniform(0, min(self.max_backoff_s, self.base_backoff_s * 2 ** attempt))
+                attempt += 1
+                LLM_RETRIES.labels(prompt_type=prompt_type).inc()
+                print(f"⚠️ LLM {prompt_type} call failed ({type(e).__name__}: {e}); retry {attempt} in {backoff:.2f}s")
+            time.sleep(min(backoff, max(0.0, deadline - time.monotonic())))
+
+
+def gateway_from_env(model_factory) -> LLMGateway:
+    hedge = os.getenv("LLM_HEDGE_AFTER_S")
+    return LLMGateway(
+        model_factory,
+        requests_per_minute=float(os.getenv("LLM_RPM", "60")),
+        tokens_per_minute=float(os.getenv("LLM_TPM", "1000000")),
+        max_concurrency=int(os.getenv("LLM_CONCURRENCY", "8")),
+        max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+        deadline_s=float(os.getenv("LLM_DEADLINE_S", "180")),
+        attempt_timeout_s=float(os.getenv("LLM_ATTEMPT_TIMEOUT_S", "90")),
+        hedge_after_s=float(hedge) if hedge else None,
+    )
@@ -0,0 +1,357 @@
+"""
+Endpoint-level load replay.
+
+    python loadtest.py                                   # in-process app, synthetic offers
+    python loadtest.py --replay offers.jsonl --levels 1,4,16,32 --duration 20
+    python loadtest.py --mode uvicorn --video-share 0.3  # local uvicorn in a background thread
+    python loadtest.py --mode url --url http://127.0.0.1:8000   # an already running server
+
+Letter traffic replays OfferRequest payloads (one JSON object per line) through
+/start-letter-generation → /resume-letter-review; a share of operations are
+/process-video calls against locally generated fixtures served by a tiny HTTP
+server. In the in-process and uvicorn modes the Gemini client is replaced by a
+FakeChatModel with a log-normal latency distribution, and the LLM gateway limits
+are raised (--llm-rpm/--llm-tpm/--llm-concurrency) so the default quota does
+not cap throughput; pass production values to load-test the quota itself.
+
+For each concurrency level it reports throughput, latency percentiles, error
+rate and event-loop lag (the server's loop in the in-process and uvicorn modes),
+and points at the level where throughput stops scaling.
+"""
+import os, sys, json, time, random, asyncio, argparse, tempfile, threading, shutil
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+os.environ.setdefault("ARTIFACT_ROOT", tempfile.mkdtemp(prefix="clipfox_load_"))
+
+import httpx
+from fakes import FakeChatModel, lognormal_latency, make_test_video
+from bench import SAMPLE_STATE
+from harness import percentile, set_llm_limits, UNTHROTTLED_LLM_RPM, UNTHROTTLED_LLM_TPM, UNTHROTTLED_LLM_CONCURRENCY
+
+OFFER_FIELDS = ["agency_name", "tenure", "fee", "requirement_list", "joining_date",
+                "client_name", "company_name", "company_email", "company_mobile"]
+
+
+# ======================================================
+# Traffic
+# ======================================================
+
+def load_offers(path: str | None) -> list[dict]:
+    """OfferRequest payloads from a JSONL file; lines missing fields are completed from a sample."""
+    sample = {k: SAMPLE_STATE[k] for k in OFFER_FIELDS}
+    if not path:
+        return [dict(sample, client_name=f"Client {i}") for i in range(50)]
+    offers = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(record, dict):
+                continue
+            offers.append({k: record.get(k) or sample[k] for k in OFFER_FIELDS})
+    if not offers:
+        raise SystemExit(f"No usable records in {path}")
+    return offers
+
+
+class FixtureServer:
+    """Serves /api/<name> in the shape download_video expects, and the clip at /media/<name>."""
+
+    def __init__(self, directory: str):
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, directory=directory, **kwargs)
+
+            def do_GET(self):
+                if self.path.startswith("/api/"):
+                    name = self.path[len("/api/"):]
+                    body = json.dumps({"success": True, "download": {"url": f"{server.base_url}/media/{name}"}}).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if self.path.startswith("/media/"):
+                    self.path = "/" + self.path[len("/media/"):]
+                super().do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+def video_request(api_url: str, width: int, height: int, seconds: float) -> dict:
+    return {
+        "crop_x": 0, "crop_y": 0, "crop_w": width, "crop_h": height,
+        "resize_w": width // 2 // 2 * 2, "resize_h": height // 2 // 2 * 2,
+        "trim_start": 0.0, "trim_end": min(2.0, seconds),
+        "edit_mode": "basic", "version_note": "loadtest", "video_url": api_url,
+    }
+
+
+# ======================================================
+# Event-loop lag
+# ======================================================
+
+class LoopLagMonitor:
+    """Samples how late a short sleep wakes up on a given loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float = 0.01):
+        self.loop = loop
+        self.interval = interval
+        self.samples: list[float] = []
+        self._slept_at = None
+        self._sampler = None
+
+    async def _run(self):
+        while True:
+            self._slept_at = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - self._slept_at - self.interval) * 1000)
+
+    def start(self):
+        self.samples = []
+        self._slept_at = None
+        # A Task on our own loop, or a concurrent Future for another thread's loop; both cancel safely
+        if self.loop is asyncio.get_running_loop():
+            self._sampler = self.loop.create_task(self._run())
+        else:
+            self._sampler = asyncio.run_coroutine_threadsafe(self._run(), self.loop)
+
+    def stop(self) -> list[float]:
+        if self._sampler is not None:
+            self._sampler.cancel()
+            self._sampler = None
+        samples = list(self.samples)
+        # A loop that stayed blocked until now never woke up to record its lag
+        if self._slept_at is not None:
+            overdue = (time.perf_counter() - self._slept_at - self.interval) * 1000
+            if overdue > 0:
+                samples.append(overdue)
+        return samples
+
+
+# ======================================================
+# Target app
+# ======================================================
+
+def install_fake_llm(median_s: float, sigma: float, fail_rate: float) -> None:
+    import agent
+    agent.llm = FakeChatModel(latency=lognormal_latency(median_s, sigma), fail_rate=fail_rate)
+
+
+def start_uvicorn(app, port: int):
+    import uvicorn
+
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    holder = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        holder["loop"] = loop
+        loop.run_until_complete(server.serve())
+
+    threading.Thread(target=run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, holder["loop"]
+
+
+# ======================================================
+# Load loop
+# ======================================================
+
+async def letter_flow(client: httpx.AsyncClient, offer: dict, record) -> None:
+    t0 = time.perf_counter()
+    r = await client.post("/start-letter-generation", json=offer)
+    record("start", t0, r.status_code)
+    if r.status_code != 200:
+        return
+    body = r.json()
+    letter = body.get("generated_letter_text") or body.get("letter_text") or ""
+
+    t1 = time.perf_counter()
+    r = await client.post("/resume-letter-review", json={
+        "session_id": body["session_id"],
+        "checkpoint_id": body["checkpoint_id"],
+        "edited_letter": letter,
+    })
+    record("resume", t1, r.status_code)
+    record("letter_flow", t0, r.status_code)
+
+
+async def video_op(client: httpx.AsyncClient, payload: dict, record) -> None:
+    t0 = time.perf_counter()
+    r = await client.post("/process-video", json=payload)
+    await r.aread()
+    record("video", t0, r.status_code)
+
+
+async def run_level(client, level: int, duration: float, offers: list[dict], video_payload,
+                    video_share: float, lag_monitor: LoopLagMonitor | None, seed: int) -> dict:
+    samples: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    rng = random.Random(seed)
+
+    def record(kind: str, t0: float, status: int):
+        samples.setdefault(kind, []).append((time.perf_counter() - t0) * 1000)
+        if status >= 400:
+            errors[kind] = errors.get(kind, 0) + 1
+
+    deadline = time.perf_counter() + duration
+    completed = 0
+
+    async def worker():
+        nonlocal completed
+        while time.perf_counter() < deadline:
+            try:
+                if video_payload and rng.random() < video_share:
+                    await video_op(client, video_payload, record)
+                else:
+                    await letter_flow(client, rng.choice(offers), record)
+            except httpx.HTTPError:
+                errors["transport"] = errors.get("transport", 0) + 1
+            completed += 1
+
+    if lag_monitor:
+        lag_monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(level)))
+    elapsed = time.perf_counter() - started
+    lag = lag_monitor.stop() if lag_monitor else []
+
+    result = {"level": level, "ops": completed, "throughput_ops_s": round(completed / elapsed, 2), "kinds": {}}
+    for kind, values in samples.items():
+        result["kinds"][kind] = {
+            "n": len(values),
+            "p50_ms": round(percentile(values, 50), 1),
+            "p95_ms": round(percentile(values, 95), 1),
+            "p99_ms": round(percentile(values, 99), 1),
+            "error_rate": round(errors.get(kind, 0) / len(values), 4),
+        }
+    result["transport_errors"] = errors.get("transport", 0)
+    if lag:
+        result["loop_lag_ms"] = {
+            "p50": round(percentile(lag, 50), 2),
+            "p99": round(percentile(lag, 99), 2),
+            "max": round(max(lag), 2),
+        }
+    return result
+
+
+def print_level(res: dict) -> None:
+    lag = res.get("loop_lag_ms")
+    lag_text = f"loop lag p50/p99/max {lag['p50']}/{lag['p99']}/{lag['max']} ms" if lag else "loop lag n/a"
+    print(f"\n── concurrency {res['level']}: {res['throughput_ops_s']} ops/s, {res['ops']} ops, {lag_text}")
+    for kind, k in res["kinds"].items():
+        print(f"   {kind:<12} n={k['n']:<5} p50={k['p50_ms']:>8} p95={k['p95_ms']:>8} p99={k['p99_ms']:>8} ms  "
+              f"errors={k['error_rate'] * 100:.1f}%")
+    if res["transport_errors"]:
+        print(f"   transport errors: {res['transport_errors']}")
+
+
+def saturation_level(results: list[dict], min_gain: float = 0.10) -> int | None:
+    """First level whose throughput gain over the previous one is below `min_gain`."""
+    for prev, cur in zip(results, results[1:]):
+        if prev["throughput_ops_s"] and cur["throughput_ops_s"] < prev["throughput_ops_s"] * (1 + min_gain):
+            return prev["level"]
+    return None
+
+
+async def main_async(args) -> list[dict]:
+    offers = load_offers(args.replay)
+
+    video_payload = None
+    fixture_server = None
+    if args.video_share > 0:
+        if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+            w, h = (int(x) for x in args.video_res.split("x"))
+            clip = make_test_video(w, h, args.video_seconds)
+            fixture_server = FixtureServer(str(clip.parent))
+            video_payload = video_request(f"{fixture_server.base_url}/api/{clip.name}", w, h, args.video_seconds)
+        else:
+            print("⚠️ ffmpeg not found: running letter traffic only")
+
+    server = None
+    if args.mode == "url":
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        lag_monitor = LoopLagMonitor(asyncio.get_running_loop())  # client-side only
+    else:
+        install_fake_llm(args.llm_median, args.llm_sigma, args.llm_fail_rate)
+        import main
+        if args.mode == "inprocess":
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                       base_url="http://loadtest", timeout=args.timeout)
+            lag_monitor = LoopLagMonitor(asyncio.get_running_loop())
+        else:
+            server, server_loop = start_uvicorn(main.app, args.port)
+            client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout)
+            lag_monitor = LoopLagMonitor(server_loop)
+
+    results = []
+    try:
+        for i, level in enumerate(int(x) for x in args.levels.split(",")):
+            res = await run_level(client, level, args.duration, offers, video_payload,
+                                  args.video_share, lag_monitor, seed=i)
+            print_level(res)
+            results.append(res)
+    finally:
+        await client.aclose()
+        if server:
+            server.should_exit = True
+        if fixture_server:
+            fixture_server.close()
+
+    knee = saturation_level(results)
+    print(f"\nSaturation: {'around concurrency ' + str(knee) if knee else 'not reached at tested levels'}")
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ClipFox endpoint load replay")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn", "url"], default="inprocess")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--replay", help="JSONL file of OfferRequest payloads")
+    parser.add_argument("--levels", default="1,2,4,8,16")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--video-share", type=float, default=0.2)
+    parser.add_argument("--video-res", default="640x360")
+    parser.add_argument("--video-seconds", type=float, default=4.0)
+    parser.add_argument("--llm-median", type=float, default=1.0, help="fake LLM median latency (s)")
+    parser.add_argument("--llm-sigma", type=float, default=0.5)
+    parser.add_argument("--llm-fail-rate", type=float, default=0.0)
+    parser.add_argument("--llm-rpm", type=float, default=UNTHROTTLED_LLM_RPM, help="gateway requests/minute")
+    parser.add_argument("--llm-tpm", type=float, default=UNTHROTTLED_LLM_TPM, help="gateway tokens/minute")
+    parser.add_argument("--llm-concurrency", type=int, default=UNTHROTTLED_LLM_CONCURRENCY)
+    parser.add_argument("--json", help="write per-level results to this file")
+    args = parser.parse_args()
+    # Before the app (and its LLM gateway) is imported
+    set_llm_limits(args.llm_rpm, args.llm_tpm, args.llm_concurrency)
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
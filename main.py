@@ -1,17 +1,84 @@
-import uuid, os, shutil
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form , BackgroundTasks
+from startup import timed_load, mark_ready, startup_report
+import uuid, os, time, math, asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse , FileResponse
-from pydantic import BaseModel
-from langgraph.types import Command
-from agent import agency_agent_app 
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse , FileResponse, StreamingResponse, Response
+from pydantic import BaseModel, ValidationError
 from fastapi.exceptions import RequestValidationError
 from pydantic import BaseModel, HttpUrl
 import os
-from typing import Optional
+from typing import Optional, Literal
 from pathlib import Path
-from ffmpeg_func import *
+from metrics import span, bind_ids, observe, render_metrics, VIDEO_PHASE_SECONDS, VIDEO_BYTES, VIDEO_REALTIME_FACTOR
+from artifact_store import get_store, ARTIFACT_GC_INTERVAL_S
+from uploads import ingest_pdf_upload, UploadRejected
+from batch import parse_batch_payload, stream_batch_zip, BATCH_CONCURRENCY
+from llm_gateway import LLMRateLimited, LLMTimeout
+
+# ======================================================
+# Lazy subsystems
+# ======================================================
+# The letter stack (langgraph, Gemini client, WeasyPrint) and the video stack
+# (ffmpeg) are only imported by the endpoints that need them, so a video-only
+# worker never loads the LLM/PDF stack and needs no GOOGLE_API_KEY.
+
+def letter_agent():
+    with timed_load("letters"):
+        from agent import get_agent_app
+        agency_agent_app = get_agent_app()
+    return agency_agent_app
+
+
+def video_tools():
+    with timed_load("video"):
+        import ffmpeg_func
+    return ffmpeg_func
+
+
+def resume_command(**resume):
+    from langgraph.types import Command
+    return Command(resume=resume)
+
+
+def llm_unavailable(e: Exception) -> HTTPException:
+    """503 + Retry-After when the LLM quota is exhausted, 504 when the call ran past its deadline."""
+    if isinstance(e, LLMRateLimited):
+        return HTTPException(status_code=503, detail=str(e),
+                             headers={"Retry-After": str(math.ceil(e.retry_after))})
+    return HTTPException(status_code=504, detail=str(e))
+
+
+# Comma-separated subsystems to warm at startup, e.g. PRELOAD_SUBSYSTEMS=letters,video
+PRELOAD_SUBSYSTEMS = [s.strip() for s in os.getenv("PRELOAD_SUBSYSTEMS", "").split(",") if s.strip()]
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if "letters" in PRELOAD_SUBSYSTEMS:
+        letter_agent()
+    if "video" in PRELOAD_SUBSYSTEMS:
+        video_tools()
+    gc_task = asyncio.create_task(artifact_gc_loop())
+    mark_ready()
+    print(f"Startup report: {startup_report()}")
+    yield
+    gc_task.cancel()
+
+
+async def artifact_gc_loop():
+    """Applies the artifact retention policy (age, then total size) periodically."""
+    try:
+        # Flat files from before the store join the index once, so retention covers them
+        await asyncio.to_thread(get_store().import_legacy, PDF_DIR)
+    except Exception as e:
+        print(f"Artifact import error: {e}")
+    while True:
+        try:
+            await asyncio.to_thread(get_store().gc)
+        except Exception as e:
+            print(f"Artifact GC error: {e}")
+        await asyncio.sleep(ARTIFACT_GC_INTERVAL_S)
 
 # ======================================================
 # FastAPI Setup
@@ -20,7 +87,8 @@ from ffmpeg_func import *
 app = FastAPI(
     title="Offer Letter Generation API",
     description="API to generate offer letters and handle human-in-the-loop review before PDF creation.",
-    version="3.0.0"
+    version="3.0.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
@@ -31,8 +99,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Uploads used to be written here; imported into the artifact store at startup,
+# still read as a fallback so old /files/edited_* links resolve meanwhile
 PDF_DIR = "generated_pdfs"
-os.makedirs(PDF_DIR, exist_ok=True)
 
 TEMP_DIR = Path("/tmp/video_processing")
 TEMP_DIR.mkdir(exist_ok=True)
@@ -51,6 +120,7 @@ class OfferRequest(BaseModel):
     company_name: str = 'Creativity Unleashed'
     company_email: str
     company_mobile: str
+    render_profile: Optional[Literal["standard", "compact"]] = None  # default: PDF_RENDER_PROFILE
 
 class VideoEditRequest(BaseModel):
     crop_h: int
@@ -65,6 +135,26 @@ class VideoEditRequest(BaseModel):
     version_note: str
     video_url: HttpUrl
 
+class TimelineClip(BaseModel):
+    video_url: HttpUrl
+    trim_start: float = 0.0
+    trim_end: Optional[float] = None          # default: end of the source
+    crop_x: int = 0
+    crop_y: int = 0
+    crop_w: Optional[int] = None               # crop only when both w and h are set
+    crop_h: Optional[int] = None
+    resize_w: Optional[int] = None             # default: fit the timeline canvas
+    resize_h: Optional[int] = None
+    transition: str = "cut"                    # how this clip joins the previous one: cut or an xfade name
+    transition_duration: float = 0.5
+
+class TimelineRequest(BaseModel):
+    clips: list[TimelineClip]
+    width: Optional[int] = None                # default: size of the first clip
+    height: Optional[int] = None
+    fps: int = 30
+    version_note: str = "timeline"
+
 # ======================================================
 # Helper
 # ======================================================
@@ -78,7 +168,16 @@ def build_reference_url(pdf_path: str) -> str:
 # ======================================================
 # 1️⃣ Start the HITL flow — pause at interrupt
 # ======================================================
-app.mount("/files", StaticFiles(directory="files"), name="files")
+@app.get("/files/{name}")
+async def serve_file(name: str):
+    """Serves generated letters and uploads by public name from the artifact store."""
+    path = await asyncio.to_thread(get_store().resolve, name)
+    if path is None:
+        legacy = os.path.join(PDF_DIR, name)
+        if not os.path.isfile(legacy):
+            raise HTTPException(status_code=404, detail="Not Found")
+        path = legacy
+    return FileResponse(path=str(path), media_type="application/pdf")
 
 
 @app.post("/start-letter-generation")
@@ -100,6 +199,7 @@ async def start_letter_generation(request: OfferRequest):
             "company_name": request.company_name,
             "company_email": request.company_email,
             "company_mobile": request.company_mobile,
+            "render_profile": request.render_profile,
             "session_id": session_id
         }
 
@@ -108,11 +208,13 @@ async def start_letter_generation(request: OfferRequest):
 
         print(f"Starting new letter generation session: {session_id}")
 
-        # Run until it hits the interrupt()
-        response = agency_agent_app.invoke(inputs, config)
+        # Run until it hits the interrupt(). The graph blocks (LLM calls, gateway
+        # quota waits, PDF render), so it runs in a worker thread, off the event loop.
+        agency_agent_app = await asyncio.to_thread(letter_agent)
+        response = await asyncio.to_thread(agency_agent_app.invoke, inputs, config)
 
         # Fetch the checkpoint ID
-        latest_snapshot = agency_agent_app.get_state(config)
+        latest_snapshot = await asyncio.to_thread(agency_agent_app.get_state, config)
         checkpoint_id = latest_snapshot.config["configurable"]["checkpoint_id"]
 
         # response will contain interrupt data like {"letter_text": "..."}
@@ -122,6 +224,9 @@ async def start_letter_generation(request: OfferRequest):
             **response  # contains the "letter_text" + "message"
         }
 
+    except (LLMRateLimited, LLMTimeout) as e:
+        print(f"Error starting letter generation (LLM unavailable): {e}")
+        raise llm_unavailable(e)
     except Exception as e:
         print(f"Error starting letter generation: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -141,6 +246,8 @@ async def resume_letter_review(body: dict):
         session_id = body["session_id"]
         checkpoint_id = body["checkpoint_id"]
         edited_letter = body["edited_letter"]
+        polish = body.get("polish")  # opt-in LLM polish pass
+        render_profile = body.get("render_profile")  # "standard" / "compact"
 
         config = {
             "configurable": {
@@ -151,10 +258,12 @@ async def resume_letter_review(body: dict):
 
         print(f"Resuming letter generation for session {session_id}")
 
-        command = Command(resume={"user_reviewed_text": edited_letter})
-        response = agency_agent_app.invoke(command, config)
+        command = resume_command(user_reviewed_text=edited_letter, polish=polish,
+                                 render_profile=render_profile, priority="interactive")
+        agency_agent_app = await asyncio.to_thread(letter_agent)
+        response = await asyncio.to_thread(agency_agent_app.invoke, command, config)
 
-        latest_snapshot = agency_agent_app.get_state(config)
+        latest_snapshot = await asyncio.to_thread(agency_agent_app.get_state, config)
 
         return {
             "session_id": session_id,
@@ -163,29 +272,63 @@ async def resume_letter_review(body: dict):
             "checkpoint_id": latest_snapshot.config['configurable']['checkpoint_id']
         }
 
+    except (LLMRateLimited, LLMTimeout) as e:
+        print(f" Error resuming letter review (LLM unavailable): {e}")
+        raise llm_unavailable(e)
     except Exception as e:
         print(f" Error resuming letter review: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 # ======================================================
-# 3️⃣ Upload edited PDFs (no change)
+# 3️⃣ Upload edited PDFs
 # ======================================================
 
 @app.post("/upload-edited")
-async def upload_edited_pdf(file: UploadFile = File(...), filename: str = Form(...)):
+async def upload_edited_pdf(request: Request):
+    """
+    Accepts multipart form data with a `file` (PDF) and a `filename` field.
+    The body is streamed, hashed and size-checked as it arrives (see uploads.py).
+    """
     try:
-        save_path = os.path.join(PDF_DIR, f"edited_{filename}")
-        with open(save_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        public_path = f"/files/edited_{filename}"
-        print(f"Edited PDF uploaded: {public_path}")
-        return JSONResponse({"success": True, "url": public_path})
+        artifact, _ = await ingest_pdf_upload(request, get_store())
+
+        public_path = artifact.url
+        print(f"Edited PDF uploaded: {public_path} ({artifact.size} bytes)")
+        return JSONResponse({"success": True, "url": public_path, "sha256": artifact.digest, "size": artifact.size})
+    except UploadRejected as e:
+        print(f" Rejected edited PDF upload: {e.detail}")
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     except Exception as e:
         print(f" Error saving edited PDF: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ======================================================
+# 4️⃣ Bulk letter generation
+# ======================================================
+
+@app.post("/batch-letter-generation")
+async def batch_letter_generation(request: Request, auto_approve: bool = False, concurrency: int = BATCH_CONCURRENCY):
+    """
+    Accepts a JSON array or JSONL body of OfferRequests and streams back a ZIP
+    with each letter PDF and email draft as its session finishes.
+    With auto_approve the human review interrupt is skipped; otherwise the ZIP
+    contains drafts plus session/checkpoint ids for /resume-letter-review.
+    """
+    try:
+        items = parse_batch_payload(await request.body())
+        offers = [OfferRequest(**item).model_dump() for item in items]
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    batch_id = uuid.uuid4().hex[:8]
+    print(f"Starting batch {batch_id}: {len(offers)} letters, auto_approve={auto_approve}")
+    return StreamingResponse(
+        stream_batch_zip(offers, auto_approve=auto_approve, concurrency=concurrency),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="letters_{batch_id}.zip"'},
+    )
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
     print(f"Validation error: {exc.errors()}")
@@ -205,68 +348,184 @@ async def process_video_endpoint(
     Process video with crop, resize, and trim operations.
     Returns the processed video file for download.
     """
+    vt = video_tools()
     job_id = str(uuid.uuid4())
     input_file = TEMP_DIR / f"input_{job_id}.mov"
     output_file = TEMP_DIR / f"output_{job_id}.mp4"
     
-    try:
-        # Download video
-        download_video(str(request.video_url), str(input_file))
+    with bind_ids(job_id=job_id):
+        try:
+            # Download video
+            with span("video.download", VIDEO_PHASE_SECONDS, phase="download") as attrs:
+                vt.download_video(str(request.video_url), str(input_file))
+                attrs["bytes"] = os.path.getsize(input_file)
+            VIDEO_BYTES.labels(direction="downloaded").inc(attrs["bytes"])
         
-        # Get video metadata
-        width, height, duration = get_video_info(str(input_file))
+            # Get video metadata
+            with span("video.probe", VIDEO_PHASE_SECONDS, phase="probe"):
+                width, height, duration = vt.get_video_info(str(input_file))
         
-        # Validate and adjust parameters
-        final_crop_w = min(request.crop_w, width)
-        final_crop_h = min(request.crop_h, height)
-        final_trim_end = min(request.trim_end, duration)
+            # Validate and adjust parameters
+            final_crop_w = min(request.crop_w, width)
+            final_crop_h = min(request.crop_h, height)
+            final_trim_end = min(request.trim_end, duration)
         
-        # Build processing parameters
-        crop_params = (request.crop_x, request.crop_y, final_crop_w, final_crop_h)
-        resize_params = (request.resize_w, request.resize_h)
-        trim_params = (request.trim_start, final_trim_end)
+            # Build processing parameters
+            crop_params = (request.crop_x, request.crop_y, final_crop_w, final_crop_h)
+            resize_params = (request.resize_w, request.resize_h)
+            trim_params = (request.trim_start, final_trim_end)
         
-        print(f"🎛️ Settings:")
-        print(f"   Crop: {crop_params}")
-        print(f"   Resize: {resize_params}")
-        print(f"   Trim: {trim_params[0]:.1f}s → {trim_params[1]:.1f}s")
+            print(f"🎛️ Settings:")
+            print(f"   Crop: {crop_params}")
+            print(f"   Resize: {resize_params}")
+            print(f"   Trim: {trim_params[0]:.1f}s → {trim_params[1]:.1f}s")
         
-        # Process video
-        process_video(
-            str(input_file), 
-            str(output_file), 
-            crop_params, 
-            resize_params, 
-            trim_params
-        )
+            # Process video
+            encode_start = time.perf_counter()
+            with span("video.encode", VIDEO_PHASE_SECONDS, phase="encode") as attrs:
+                vt.process_video(
+                    str(input_file), 
+                    str(output_file), 
+                    crop_params, 
+                    resize_params, 
+                    trim_params
+                )
+            
+                if not os.path.exists(output_file):
+                    raise Exception("Output file not created")
+                attrs["bytes"] = os.path.getsize(output_file)
+                attrs["realtime_factor"] = round((trim_params[1] - trim_params[0]) / (time.perf_counter() - encode_start), 3)
+            VIDEO_BYTES.labels(direction="encoded").inc(attrs["bytes"])
+            observe(VIDEO_REALTIME_FACTOR, attrs["realtime_factor"])
         
-        if not os.path.exists(output_file):
-            raise Exception("Output file not created")
+            # Schedule cleanup after response is sent
+            background_tasks.add_task(vt.cleanup_files, str(input_file), str(output_file))
         
-        # Schedule cleanup after response is sent
-        background_tasks.add_task(cleanup_files, str(input_file), str(output_file))
+            # Return file for download
+            return FileResponse(
+                path=str(output_file),
+                media_type='video/mp4',
+                filename=f"processed_{request.version_note.replace(' ', '_')}.mp4",
+                background=background_tasks
+            )
         
-        # Return file for download
-        return FileResponse(
-            path=str(output_file),
-            media_type='video/mp4',
-            filename=f"processed_{request.version_note.replace(' ', '_')}.mp4",
-            background=background_tasks
-        )
-        
-    except Exception as e:
-        # Clean up on error
-        cleanup_files(str(input_file), str(output_file))
-        raise HTTPException(status_code=500, detail=str(e))
+        except Exception as e:
+            # Clean up on error
+            vt.cleanup_files(str(input_file), str(output_file))
+            raise HTTPException(status_code=500, detail=str(e))
+
+
+# ======================================================
+# Multi-clip timeline
+# ======================================================
+
+@app.post("/process-timeline")
+async def process_timeline_endpoint(
+    request: TimelineRequest,
+    background_tasks: BackgroundTasks
+):
+    """
+    Renders several clips (trim/crop/resize each, joined by cuts or transitions)
+    into one video with a single ffmpeg filtergraph and one encode pass.
+    Each distinct source URL is downloaded once; clips close together in a source
+    share one decode, the rest are seeked separately.
+    """
+    vt = video_tools()
+    job_id = str(uuid.uuid4())
+    urls = list(dict.fromkeys(str(clip.video_url) for clip in request.clips))
+    input_files = {url: TEMP_DIR / f"input_{job_id}_{i}.mov" for i, url in enumerate(urls)}
+    output_file = TEMP_DIR / f"output_{job_id}.mp4"
+    temp_files = [str(path) for path in input_files.values()] + [str(output_file)]
+
+    with bind_ids(job_id=job_id):
+        try:
+            if not request.clips:
+                raise ValueError("Timeline has no clips")
+            if request.fps <= 0:
+                raise ValueError(f"Invalid frame rate {request.fps}")
+            for clip in request.clips:
+                if clip.transition not in ("cut", *vt.XFADE_TRANSITIONS):
+                    raise ValueError(f"Unknown transition: {clip.transition}")
+                if clip.transition != "cut" and clip.transition_duration <= 0:
+                    raise ValueError(f"Invalid transition duration {clip.transition_duration}s")
+                if clip.trim_start < 0 or (clip.trim_end is not None and clip.trim_end <= clip.trim_start):
+                    raise ValueError(f"Invalid trim {clip.trim_start}-{clip.trim_end}s")
+                if clip.crop_x < 0 or clip.crop_y < 0:
+                    raise ValueError(f"Invalid crop offset {clip.crop_x},{clip.crop_y}")
+
+            # Download every distinct source concurrently
+            with span("video.download", VIDEO_PHASE_SECONDS, phase="download") as attrs:
+                await asyncio.gather(*(asyncio.to_thread(vt.download_video, url, str(path))
+                                       for url, path in input_files.items()))
+                attrs["sources"] = len(urls)
+                attrs["bytes"] = sum(os.path.getsize(path) for path in input_files.values())
+            VIDEO_BYTES.labels(direction="downloaded").inc(attrs["bytes"])
+
+            with span("video.probe", VIDEO_PHASE_SECONDS, phase="probe"):
+                probes = await asyncio.gather(*(asyncio.to_thread(vt.probe_source, str(path))
+                                                for path in input_files.values()))
+                sources = dict(zip(input_files, probes))
+
+            clips = [{
+                "source": str(clip.video_url),
+                "trim": (clip.trim_start, clip.trim_end),
+                "crop": (clip.crop_x, clip.crop_y, clip.crop_w, clip.crop_h) if clip.crop_w and clip.crop_h else None,
+                "resize": (clip.resize_w, clip.resize_h) if clip.resize_w and clip.resize_h else None,
+                "transition": clip.transition,
+                "transition_duration": clip.transition_duration,
+            } for clip in request.clips]
+            size = (request.width, request.height) if request.width and request.height else None
+
+            print(f"🎞️ Timeline: {len(clips)} clips from {len(urls)} sources")
+
+            encode_start = time.perf_counter()
+            with span("video.encode", VIDEO_PHASE_SECONDS, phase="encode") as attrs:
+                duration = await asyncio.to_thread(vt.render_timeline, clips, sources, str(output_file), size, request.fps)
+
+                if not os.path.exists(output_file):
+                    raise Exception("Output file not created")
+                attrs["clips"] = len(clips)
+                attrs["bytes"] = os.path.getsize(output_file)
+                attrs["realtime_factor"] = round(duration / (time.perf_counter() - encode_start), 3)
+            VIDEO_BYTES.labels(direction="encoded").inc(attrs["bytes"])
+            observe(VIDEO_REALTIME_FACTOR, attrs["realtime_factor"])
+
+            background_tasks.add_task(vt.cleanup_files, *temp_files)
+
+            return FileResponse(
+                path=str(output_file),
+                media_type='video/mp4',
+                filename=f"timeline_{request.version_note.replace(' ', '_')}.mp4",
+                background=background_tasks
+            )
+
+        except ValueError as e:
+            vt.cleanup_files(*temp_files)
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            vt.cleanup_files(*temp_files)
+            raise HTTPException(status_code=500, detail=str(e))
 
 
+# ======================================================
+# Metrics
+# ======================================================
 
+@app.get("/metrics")
+def read_metrics(request: Request):
+    body, content_type = render_metrics(request.headers.get("accept", ""))
+    return Response(content=body, media_type=content_type)
 
 
 # ======================================================
 # Health Check
 # ======================================================
 
+@app.get("/startup-report")
+def read_startup_report():
+    return startup_report()
+
+
 @app.get("/")
 def read_root():
     return {"status": "Offer Letter API with Human-in-the-Loop is running 🚀"}
@@ -0,0 +1,88 @@
+import re
+
+# Rule-based Markdown formatter for reviewed letters.
+# Produces the same shape the LLM refine pass is asked for (### headers,
+# **bold** key terms, lists) without a model round-trip.
+
+_BULLET = re.compile(r"^\s*(?:[-*+•·–])\s+(.*)$")
+_NUMBERED = re.compile(r"^\s*(\d+)[.)]\s+(.*)$")
+_LABEL = re.compile(r"^([A-Z][\w /&()'-]{1,30}):\s+(\S.*)$")
+_MD_BLOCK = re.compile(r"^\s*(?:#{1,6}\s|>|```|\|)")
+# Formal salutations end with ":" in business letters but are not section headers
+_SALUTATION = re.compile(r"^(?:dear|to whom|to the|hello|hi|greetings|gentlemen|ladies|madam|sir|attn|attention)\b", re.I)
+
+
+def _is_header(line: str) -> bool:
+    if len(line) > 60 or line.endswith((".", ",", ";")) or _SALUTATION.match(line):
+        return False
+    letters = [c for c in line if c.isalpha()]
+    if line.endswith(":"):
+        return len(line) > 1 and len(line.split()) <= 8
+    return len(letters) >= 2 and all(c.isupper() for c in letters)
+
+
+def _bold_terms(line: str, key_terms) -> str:
+    for term in key_terms:
+        if len(term) < 2 or f"**{term}**" in line:
+            continue
+        line = re.sub(rf"(?<![\w*]){re.escape(term)}(?![\w*])", f"**{term}**", line)
+    return line
+
+
+def format_letter_markdown(text: str, key_terms=()) -> str:
+    """
+    Deterministically turns plain (or lightly edited) letter text into Markdown.
+    Headers become ###, "Label: value" lines get a bold label, bullets and
+    numbered items are normalised, and `key_terms` are bolded in body text.
+    Line breaks inside a paragraph are kept as Markdown hard breaks so address
+    and signature blocks survive rendering.
+    """
+    key_terms = sorted({t.strip() for t in key_terms if t and t.strip()}, key=len, reverse=True)
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+    blocks = []   # list of (kind, [lines]) with kind in {"p", "ul", "ol", "header", "raw", "blank"}
+    for raw in lines:
+        line = raw.rstrip()
+        stripped = line.strip()
+        if not stripped:
+            blocks.append(("blank", []))
+            continue
+
+        bullet = _BULLET.match(line)
+        numbered = _NUMBERED.match(line)
+        if _MD_BLOCK.match(line):
+            _append(blocks, "raw", line)
+        elif bullet and not stripped.startswith("**"):
+            item = f"- {_bold_terms(bullet.group(1), key_terms)}"
+            _append(blocks, "ul", item)
+        elif numbered:
+            item = f"{numbered.group(1)}. {_bold_terms(numbered.group(2), key_terms)}"
+            _append(blocks, "ol", item)
+        elif _is_header(stripped):
+            blocks.append(("header", [f"### {stripped.rstrip(':').strip()}"]))
+        else:
+            label = _LABEL.match(stripped)
+            if label and not stripped.startswith("**"):
+                stripped = f"**{label.group(1)}:** {label.group(2)}"
+            else:
+                stripped = _bold_terms(stripped, key_terms)
+            _append(blocks, "p", stripped)
+
+    out = []
+    for kind, block_lines in blocks:
+        if kind == "blank":
+            continue
+        if kind == "p":
+            body = "  \n".join(block_lines)
+        else:
+            body = "\n".join(block_lines)
+        out.append(body)
+    return "\n\n".join(out).strip() + "\n"
+
+
+def _append(blocks: list, kind: str, line: str) -> None:
+    # Consecutive lines of the same kind form one block; anything else starts a new one
+    if blocks and blocks[-1][0] == kind:
+        blocks[-1][1].append(line)
+    else:
+        blocks.append((kind, [line]))
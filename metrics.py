@@ -0,0 +1,128 @@
+import os, json, time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram, REGISTRY, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client.openmetrics import exposition as openmetrics
+
+# Hot-path instrumentation, exported in Prometheus format by GET /metrics.
+#
+# session_id / job_id are deliberately not metric labels (one series per session
+# would explode cardinality). Instead they are attached as exemplars (visible in
+# the OpenMetrics exposition) and written on every span log line.
+
+SPAN_LOG = os.getenv("SPAN_LOG", "true").lower() in ("1", "true", "yes")
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120, 300)
+
+NODE_SECONDS = Histogram(
+    "clipfox_letter_node_duration_seconds", "Time spent in each LangGraph node", ["node"], buckets=_LATENCY_BUCKETS
+)
+LLM_SECONDS = Histogram(
+    "clipfox_llm_call_duration_seconds", "LLM call latency by prompt type", ["prompt_type"], buckets=_LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter(
+    "clipfox_llm_tokens", "LLM tokens by prompt type and direction (input/output)", ["prompt_type", "direction"]
+)
+LLM_QUEUE_SECONDS = Histogram(
+    "clipfox_llm_queue_wait_seconds", "Time spent waiting for LLM quota or a free slot", ["priority"],
+    buckets=_LATENCY_BUCKETS,
+)
+LLM_RETRIES = Counter("clipfox_llm_retries", "Retried LLM calls by prompt type", ["prompt_type"])
+LLM_HEDGES = Counter("clipfox_llm_hedged_requests", "Hedge requests sent for slow LLM calls")
+LLM_REJECTED = Counter("clipfox_llm_rejected", "LLM calls given up by the gateway", ["reason"])
+PDF_RENDER_SECONDS = Histogram(
+    "clipfox_pdf_render_duration_seconds", "WeasyPrint render time by render profile", ["profile"],
+    buckets=_LATENCY_BUCKETS,
+)
+PDF_SIZE_BYTES = Histogram(
+    "clipfox_pdf_size_bytes", "Rendered letter PDF size by render profile", ["profile"],
+    buckets=(25e3, 50e3, 100e3, 200e3, 400e3, 800e3, 1.6e6, 3.2e6, 6.4e6),
+)
+VIDEO_PHASE_SECONDS = Histogram(
+    "clipfox_video_phase_duration_seconds", "Video job phases (download, probe, encode)", ["phase"],
+    buckets=_LATENCY_BUCKETS,
+)
+VIDEO_BYTES = Counter("clipfox_video_bytes", "Video bytes by direction (downloaded/encoded)", ["direction"])
+VIDEO_REALTIME_FACTOR = Histogram(
+    "clipfox_video_encode_realtime_factor", "Seconds of output encoded per wall-clock second",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+SPAN_ERRORS = Counter("clipfox_span_errors", "Failed spans by span name", ["span"])
+
+_trace_ids: ContextVar[dict] = ContextVar("clipfox_trace_ids", default={})
+
+
+@contextmanager
+def bind_ids(**ids):
+    """Tags every span opened inside the block with these ids (e.g. session_id, job_id)."""
+    token = _trace_ids.set({**_trace_ids.get(), **{k: str(v) for k, v in ids.items() if v}})
+    try:
+        yield
+    finally:
+        _trace_ids.reset(token)
+
+
+def _exemplar() -> dict | None:
+    ids = _trace_ids.get()
+    return {k: v[:64] for k, v in ids.items()} or None
+
+
+def observe(histogram, value: float, **labels) -> None:
+    target = histogram.labels(**labels) if labels else histogram
+    target.observe(value, exemplar=_exemplar())
+
+
+@contextmanager
+def span(name: str, histogram=None, **labels):
+    """
+    Times the block, observes `histogram` (with `labels`) and logs one JSON line
+    with the bound ids. Yields a dict the caller can add attributes to.
+    A LangGraph interrupt is recorded as "interrupted", not as an error, and is left out
+    of the histogram since its duration includes waiting for a human.
+    """
+    attrs = {}
+    outcome = "ok"
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except BaseException as e:
+        outcome = "interrupted" if type(e).__name__ == "GraphInterrupt" else "error"
+        if outcome == "error":
+            SPAN_ERRORS.labels(span=name).inc()
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        if histogram is not None and outcome != "interrupted":
+            observe(histogram, seconds, **labels)
+        if SPAN_LOG:
+            record = {"span": name, "ms": round(seconds * 1000, 2), "outcome": outcome,
+                      **_trace_ids.get(), **labels, **attrs}
+            print(json.dumps(record, default=str))
+
+
+def traced_node(name: str, fn):
+    """Wraps a graph node so it runs inside a span tied to the state's session_id."""
+    def wrapper(state, *args, **kwargs):
+        with bind_ids(session_id=state.get("session_id")):
+            with span(f"node.{name}", NODE_SECONDS, node=name):
+                return fn(state, *args, **kwargs)
+    wrapper.__name__ = fn.__name__
+    wrapper.__doc__ = fn.__doc__
+    wrapper.__annotations__ = fn.__annotations__
+    return wrapper
+
+
+def record_llm_usage(prompt_type: str, message) -> dict:
+    """Counts tokens from a chat message's usage_metadata; returns them for span attributes."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    tokens = {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0)}
+    LLM_TOKENS.labels(prompt_type=prompt_type, direction="input").inc(tokens["input_tokens"])
+    LLM_TOKENS.labels(prompt_type=prompt_type, direction="output").inc(tokens["output_tokens"])
+    return tokens
+
+
+def render_metrics(accept: str = "") -> tuple[bytes, str]:
+    """Prometheus text format, or OpenMetrics (which carries the exemplars) when asked for."""
+    if "application/openmetrics-text" in accept:
+        return openmetrics.generate_latest(REGISTRY), openmetrics.CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
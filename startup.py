@@ -0,0 +1,37 @@
+import time, threading
+from contextlib import contextmanager
+
+# Timings for lazily loaded subsystems, reported by GET /startup-report.
+# Importing this module is cheap on purpose: it is the first thing main.py loads.
+
+_process_t0 = time.perf_counter()
+_lock = threading.Lock()
+_timings: dict[str, float] = {}
+_ready_at: float | None = None
+
+
+@contextmanager
+def timed_load(name: str):
+    """Records how long the first load of `name` took (later loads are ignored)."""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    with _lock:
+        if name not in _timings:
+            _timings[name] = elapsed
+            print(f"⏱️ Loaded {name} in {elapsed * 1000:.0f} ms")
+
+
+def mark_ready() -> None:
+    global _ready_at
+    _ready_at = time.perf_counter()
+
+
+def startup_report() -> dict:
+    with _lock:
+        loaded = {name: round(seconds * 1000, 1) for name, seconds in _timings.items()}
+    return {
+        "startup_ms": round((_ready_at - _process_t0) * 1000, 1) if _ready_at else None,
+        "uptime_s": round(time.perf_counter() - _process_t0, 1),
+        "loaded_subsystems_ms": loaded,
+    }
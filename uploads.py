@@ -0,0 +1,158 @@
+import os, asyncio, hashlib
+from artifact_store import ArtifactStore, Artifact
+
+try:
+    import python_multipart as multipart
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    import multipart
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import parse_options_header
+
+# Streaming ingest for /upload-edited.
+#
+# The multipart body is parsed straight off the request stream, so the PDF is
+# hashed and written to the artifact store's scratch dir chunk by chunk (in a
+# worker thread), rejected as soon as it is too large or isn't a PDF, and only
+# committed (atomic rename, deduped by hash) once the whole part arrived.
+
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(25 * 1024 * 1024)))
+MAX_FIELD_BYTES = 64 * 1024
+PDF_MAGIC = b"%PDF-"
+MAGIC_WINDOW = 1024  # the PDF header may follow a few bytes of junk
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _write_and_hash(f, h, data: bytes) -> None:
+    # hashlib releases the GIL for large buffers, so both run off the event loop
+    h.update(data)
+    f.write(data)
+
+
+class _PdfPartIngest:
+    """Parser callbacks for a form with one `file` part and small text fields."""
+
+    def __init__(self, file_field: str):
+        self.file_field = file_field
+        self.fields: dict[str, str] = {}
+        self.pending: list[bytes] = []   # file bytes parsed from the current chunk
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name = None
+        self._is_file = False
+        self.seen_file = False
+        self._field_data = bytearray()
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._field_data = bytearray()
+
+    def on_header_field(self, data, start, end):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        self._name = options.get(b"name", b"").decode("utf-8", "replace")
+        self._is_file = b"filename" in options
+        if self._is_file:
+            if self._name != self.file_field or self.seen_file:
+                raise UploadRejected(400, f"Expected a single '{self.file_field}' file part")
+            self.seen_file = True
+
+    def on_part_data(self, data, start, end):
+        if self._is_file:
+            self.pending.append(data[start:end])
+        else:
+            self._field_data.extend(data[start:end])
+            if len(self._field_data) > MAX_FIELD_BYTES:
+                raise UploadRejected(413, f"Form field '{self._name}' is too large")
+
+    def on_part_end(self):
+        if not self._is_file:
+            self.fields[self._name] = self._field_data.decode("utf-8", "replace")
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+        }
+
+
+async def ingest_pdf_upload(request, store: ArtifactStore, name_field: str = "filename",
+                            file_field: str = "file", max_bytes: int = UPLOAD_MAX_BYTES) -> tuple[Artifact, dict]:
+    """
+    Streams a multipart PDF upload into `store`.
+    Returns the committed artifact (named `edited_<filename>`) and the text fields.
+    Raises UploadRejected with an HTTP status for bad or oversized uploads.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadRejected(400, "Expected multipart/form-data")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + MAX_FIELD_BYTES:
+        raise UploadRejected(413, f"Upload exceeds {max_bytes} bytes")
+
+    ingest = _PdfPartIngest(file_field)
+    parser = multipart.MultipartParser(params[b"boundary"], ingest.callbacks())
+    h = hashlib.sha256()
+    size = 0
+    head = b""
+    tmp_path = store.new_temp_path(".pdf")
+    f = await asyncio.to_thread(open, tmp_path, "wb")
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for data in ingest.pending:
+                size += len(data)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"Upload exceeds {max_bytes} bytes")
+                if len(head) < MAGIC_WINDOW:
+                    head += data[:MAGIC_WINDOW - len(head)]
+                    if len(head) >= MAGIC_WINDOW and PDF_MAGIC not in head:
+                        raise UploadRejected(415, "File is not a PDF")
+                await asyncio.to_thread(_write_and_hash, f, h, data)
+            ingest.pending.clear()
+        parser.finalize()
+        await asyncio.to_thread(f.close)
+
+        if not ingest.seen_file:
+            raise UploadRejected(400, f"Missing '{file_field}' file part")
+        if PDF_MAGIC not in head:
+            raise UploadRejected(415, "File is not a PDF")
+        filename = os.path.basename(ingest.fields.get(name_field, "").strip())
+        if not filename or filename.startswith("."):
+            raise UploadRejected(400, f"Missing or invalid '{name_field}' field")
+
+        artifact = await asyncio.to_thread(
+            store.commit, tmp_path, f"edited_{filename}", None, h.hexdigest(), size
+        )
+        return artifact, ingest.fields
+    except FormParserError:
+        raise UploadRejected(400, "Invalid multipart data")
+    finally:
+        if not f.closed:
+            await asyncio.to_thread(f.close)
+        if tmp_path.exists():
+            tmp_path.unlink()